@@ -0,0 +1,64 @@
+"""
+Photo collage layout and rendering engine.
+
+Importable without Streamlit. Names are resolved lazily, so a worker that only plans layouts never imports
+Pillow, and one that renders never imports the web front end.
+"""
+import importlib
+
+_EXPORTS = {
+    "constants": [
+        "BAND_MEMORY_BYTES", "DECODE_CACHE_BYTES", "DECODE_CACHE_DIR", "DEFAULT_WORKERS", "GOLDEN_RATIO", "LAYOUTS",
+        "MAX_CANVAS_SIDE", "MAX_IMAGES", "MAX_PADDING", "MAX_SOURCE_SIDE", "MAX_VARIANTS", "MIN_BAND_ROWS",
+        "MIN_IMAGES", "MIN_PADDING", "NORMALIZED_QUALITY", "PREVIEW_SIZE", "PROXY_SIZE", "RENDER_BACKENDS",
+        "RENDER_QUALITIES", "SEARCH_SAMPLES", "SEARCH_WEIGHTS", "SOCIAL_MEDIA_IMAGE_SIZES", "THUMBNAIL_SIZE",
+        "TILE_CACHE_BYTES",
+    ],
+    "layouts": [
+        "Placement", "aspect_class", "fit_crop", "plan_auto", "plan_golden_ratio", "plan_grid", "plan_justified",
+        "plan_lane", "plan_layout", "plan_variants", "preview_scale", "scale_plan",
+    ],
+    "sources": [
+        "IngestedImage", "content_hash", "decode_for_tiles", "decoded_size", "fit_tiles", "ingest", "load_for_size",
+        "make_proxy", "normalize_image", "source_label", "source_sizes",
+    ],
+    "banded": [
+        "banded_collage", "check_canvas_size", "plan_bands", "render_banded",
+    ],
+    "decode_cache": [
+        "DecodeCache", "configure_decode_cache",
+    ],
+    "render": [
+        "TILE_CACHE", "TileCache", "auto_layout", "contact_sheet", "fanout_collages", "golden_ratio_collage",
+        "grid_collage", "lane_collage", "load_tiles", "new_canvas", "render_plan", "render_plans", "render_preview",
+        "render_variants", "tile_key",
+    ],
+    "profiling": [
+        "PROFILE_HOOKS", "STAGES", "RenderProfile", "StageRecord", "current_profile", "peak_rss", "profiled",
+        "run_profiled",
+    ],
+    "search": [
+        "score_plan", "search_layout",
+    ],
+    "export": [
+        "DEFAULT_COMPRESS_LEVEL", "DEFAULT_EXPORT_QUALITY", "EXPORT_FORMATS", "PngWriter", "encode_collage",
+        "slugify", "zip_collages",
+    ],
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
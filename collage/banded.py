@@ -0,0 +1,200 @@
+"""
+Banded rendering of canvases too large to hold in memory, e.g. prints and posters of any size.
+
+The canvas is composited in horizontal bands that are streamed to a PNG as they are finished. A source is decoded
+when the first band that crosses one of its cells comes up and dropped after the last, and every band only fits
+the slice of each tile inside it.
+"""
+import logging
+import random
+
+from PIL import Image
+
+from .constants import BAND_MEMORY_BYTES, MAX_CANVAS_SIDE, MIN_BAND_ROWS, RENDER_BACKENDS
+from .export import DEFAULT_COMPRESS_LEVEL, PngWriter
+from .layouts import fit_crop, plan_layout
+from .profiling import timed
+from .render import _run_jobs
+from .sources import _fit, decode_for_tiles, decoded_size, source_label, source_sizes
+
+logger = logging.getLogger(__name__)
+
+# Bytes a band needs per pixel: the band itself, the tile slices pasted onto it, and the filtered rows of the
+# encoder. Pillow keeps RGB pixels in 4 bytes
+BAND_PIXEL_BYTES = 12
+
+
+def _decode_job(job):
+    return decode_for_tiles(*job)
+
+
+def check_canvas_size(size):
+    """Raise ValueError unless `size` is a (width, height) pair of 1-MAX_CANVAS_SIDE pixels."""
+    if len(size) != 2 or not all(isinstance(side, int) and 0 < side <= MAX_CANVAS_SIDE for side in size):
+        raise ValueError(f"Canvas sides must be between 1 and {MAX_CANVAS_SIDE} px.")
+
+
+def plan_bands(plan, size, decoded_bytes, memory_budget=BAND_MEMORY_BYTES, background_bytes=0):
+    """
+    Split the canvas into bands of rows, each as tall as the memory budget allows.
+
+    Parameters:
+        plan (list): Placement tuples.
+        size (tuple): Canvas (width, height).
+        decoded_bytes (dict): Source index -> bytes of its decoded image, see decoded_size().
+        memory_budget (int): Bytes a band may use, including every source decoded while it is rendered.
+        background_bytes (int): Bytes of a decoded background image, which stays decoded throughout.
+
+    Returns:
+        list: (top, bottom) row ranges covering the canvas.
+
+    Notes:
+        - A source stays decoded from the first to the last row of all of its cells.
+        - Bands are never thinner than MIN_BAND_ROWS, so a budget smaller than the sources a band needs is exceeded.
+    """
+    width, height = size
+    spans = {}
+    for placement in plan:
+        top, bottom = spans.get(placement.index, (placement.y, placement.y + placement.height))
+        spans[placement.index] = (min(top, placement.y), max(bottom, placement.y + placement.height))
+
+    def cost(top, bottom):
+        return ((bottom - top) * width * BAND_PIXEL_BYTES + background_bytes
+                + sum(decoded_bytes[index] for index, (first, last) in spans.items() if first < bottom and last > top))
+
+    bands, top, peak = [], 0, 0
+    while top < height:
+        # The tallest band within the budget; cost only grows with the band
+        low, high = min(height, top + MIN_BAND_ROWS), height
+        while low < high:
+            middle = (low + high + 1) // 2
+            if cost(top, middle) <= memory_budget:
+                low = middle
+            else:
+                high = middle - 1
+        peak = max(peak, cost(top, low))
+        bands.append((top, low))
+        top = low
+    if peak > memory_budget:
+        logger.warning("The sources of a band need %.0f MB, over the %.0f MB budget", peak / 2 ** 20,
+                       memory_budget / 2 ** 20)
+    return bands
+
+
+def render_banded(plan, images, size, file, background="#ffffff", quality="quality",
+                  compress_level=DEFAULT_COMPRESS_LEVEL, memory_budget=BAND_MEMORY_BYTES, backend="thread",
+                  workers=None):
+    """
+    Execute a placement plan band by band, streaming the canvas to a PNG.
+
+    Parameters:
+        plan (list): Placement tuples produced by one of the plan_* functions.
+        images (list): Sources the placement indexes point into.
+        size (tuple): Canvas (width, height), up to MAX_CANVAS_SIDE on either side.
+        file (str | file-like): Path or binary file the PNG is written to.
+        background (str | image source): Background color, or an image fitted to the canvas.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        compress_level (int): PNG zlib level, 0-9.
+        memory_budget (int): Bytes the decoded sources and the current band may use, see plan_bands().
+        backend (str): Execution backend for decoding the sources a band adds, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+
+    Returns:
+        list: The (top, bottom) bands rendered.
+    """
+    check_canvas_size(size)
+    if backend not in RENDER_BACKENDS:
+        raise ValueError("Backend must be 'thread', 'process' or 'serial'.")
+
+    targets = {}
+    for placement in plan:
+        targets.setdefault(placement.index, []).append(((placement.width, placement.height), placement.crop))
+    decoded_bytes = {}
+    for index, source_targets in targets.items():
+        decoded_width, decoded_height = decoded_size(images[index], source_targets, quality)
+        decoded_bytes[index] = decoded_width * decoded_height * 4
+    background_image, background_bytes = None, 0
+    if not isinstance(background, str):
+        decoded_width, decoded_height = decoded_size(background, [(size, None)], quality)
+        background_bytes = decoded_width * decoded_height * 4
+        background_image = decode_for_tiles(background, [(size, None)], quality)
+
+    bands = plan_bands(plan, size, decoded_bytes, memory_budget, background_bytes)
+    last_rows = {}
+    for placement in plan:
+        last_rows[placement.index] = max(last_rows.get(placement.index, 0), placement.y + placement.height)
+
+    if isinstance(file, str):
+        with open(file, "wb") as output:
+            _render_bands(plan, images, size, output, bands, targets, last_rows, background, background_image,
+                          quality, compress_level, backend, workers)
+    else:
+        _render_bands(plan, images, size, file, bands, targets, last_rows, background, background_image, quality,
+                      compress_level, backend, workers)
+    return bands
+
+
+def _render_bands(plan, images, size, file, bands, targets, last_rows, background, background_image, quality,
+                  compress_level, backend, workers):
+    width = size[0]
+    decoded = {}
+    with PngWriter(file, size, compress_level) as writer:
+        for top, bottom in bands:
+            crossing = [placement for placement in plan
+                        if placement.y < bottom and placement.y + placement.height > top]
+            # Decode the sources this band reaches first, in parallel
+            new = sorted({placement.index for placement in crossing} - set(decoded))
+            jobs = [(images[index], targets[index], quality) for index in new]
+            decoded.update(zip(new, _run_jobs(_decode_job, jobs, backend, workers)))
+
+            if background_image is None:
+                band = Image.new("RGB", (width, bottom - top), background)
+            else:
+                band = _fit(background_image, size, fit_crop(background_image.size, size), quality,
+                            rows=(top, bottom)).convert("RGB")
+            for placement in crossing:
+                rows = (max(top, placement.y) - placement.y, min(bottom, placement.y + placement.height) - placement.y)
+                source, cell = decoded[placement.index], (placement.width, placement.height)
+                tile = _fit(source, cell, placement.crop or fit_crop(source.size, cell), quality,
+                            source_label(images[placement.index]), rows=rows)
+                with timed("paste", source_label(images[placement.index]), target_size=tile.size):
+                    band.paste(tile, (placement.x, placement.y + rows[0] - top))
+            writer.write(band)
+
+            for index in [index for index in decoded if last_rows[index] <= bottom]:
+                del decoded[index]
+
+
+def banded_collage(images, layout, size, file, padding, randomization=False, centered=False, background="#ffffff",
+                   quality="quality", compress_level=DEFAULT_COMPRESS_LEVEL, memory_budget=BAND_MEMORY_BYTES,
+                   backend="thread", workers=None, seed=None):
+    """
+    Render a collage of any size straight to a PNG, holding at most a band of it in memory.
+
+    Parameters:
+        images (list): Image sources.
+        layout (str): One of LAYOUTS.
+        size (tuple): Canvas (width, height), up to MAX_CANVAS_SIDE on either side.
+        file (str | file-like): Path or binary file the PNG is written to.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        background (str | image source): Background color, or an image fitted to the canvas.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        compress_level (int): PNG zlib level, 0-9.
+        memory_budget (int): Bytes the decoded sources and the current band may use.
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        seed (int): Seed of the randomized arrangement (default: the global `random` state).
+
+    Returns:
+        list: The (top, bottom) bands rendered.
+
+    Notes:
+        - The geometry is planned exactly like for the fixed sizes; only its execution is banded.
+    """
+    check_canvas_size(size)
+    rng = None if seed is None else random.Random(seed)
+    plan = plan_layout(layout, source_sizes(images), size, padding, randomization, centered, rng)
+    return render_banded(plan, images, size, file, background, quality, compress_level, memory_budget, backend,
+                         workers)
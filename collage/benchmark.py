@@ -0,0 +1,290 @@
+"""
+Benchmark the collage functions on synthetic sources.
+
+    python -m collage.benchmark --repeats 3 --save-baseline
+    python -m collage.benchmark --repeats 3            # compare against benchmarks/baseline.json
+
+Every collage function is run for each image count and platform size. Latency percentiles and throughput are
+reported per function, together with the process's peak RSS. A baseline written with --save-baseline is compared on
+the next run, and the exit status is 1 when a function got slower than --tolerance allows.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from .constants import (MAX_IMAGES, MAX_PADDING, MIN_IMAGES, MIN_PADDING, RENDER_BACKENDS, RENDER_QUALITIES,
+                        SOCIAL_MEDIA_IMAGE_SIZES)
+from .profiling import peak_rss
+from .render import TILE_CACHE, auto_layout, golden_ratio_collage, grid_collage, lane_collage
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+
+def _grid(images, canvas, padding, options):
+    return grid_collage(images, canvas, padding, False, False, **options)
+
+
+def _stack(images, canvas, padding, options):
+    return lane_collage(images, canvas, padding, False, False, orientation="horizontal", **options)
+
+
+def _strip(images, canvas, padding, options):
+    return lane_collage(images, canvas, padding, False, False, orientation="vertical", **options)
+
+
+def _golden_ratio(images, canvas, padding, options):
+    return golden_ratio_collage(images, canvas, padding, False, **options)
+
+
+def _auto(images, canvas, padding, options):
+    return auto_layout(images, canvas, padding, False, False, **options)
+
+
+BENCHMARKS = {
+    "grid_collage": _grid,
+    "lane_collage[horizontal]": _stack,
+    "lane_collage[vertical]": _strip,
+    "golden_ratio_collage": _golden_ratio,
+    "auto_layout": _auto,
+}
+
+
+def parse_aspects(value):
+    """Parse "4:3,3:4,1:1" into [4 / 3, 3 / 4, 1.0]."""
+    aspects = []
+    for item in value.split(","):
+        width, _, height = item.partition(":")
+        aspects.append(float(width) / float(height or 1))
+    return aspects
+
+
+def synthetic_sources(count, megapixels, aspects, png_share=0.0, seed=0):
+    """
+    Generate encoded photo-like test images: smooth color fields with sensor-like noise.
+
+    Parameters:
+        count (int): Number of images.
+        megapixels (float): Resolution of each image.
+        aspects (list): Width / height ratios, cycled through in order.
+        png_share (float): Fraction of the images encoded as PNG instead of JPEG.
+        seed (int): Seed for the content and the PNG selection.
+
+    Returns:
+        list: Encoded images as bytes.
+    """
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    sources = []
+    for idx in range(count):
+        aspect = aspects[idx % len(aspects)]
+        width = max(1, round(math.sqrt(megapixels * 1e6 * aspect)))
+        height = max(1, round(width / aspect))
+        # Upscaled coarse noise gives photo-like gradients, fine noise keeps the encoder and decoder honest
+        coarse = Image.fromarray(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)).resize((width, height),
+                                                                                      Image.Resampling.BICUBIC)
+        grain = rng.integers(-12, 13, (height, width, 1), dtype=np.int16)
+        pixels = np.clip(np.asarray(coarse, dtype=np.int16) + grain, 0, 255).astype(np.uint8)
+
+        buffer = io.BytesIO()
+        if picker.random() < png_share:
+            Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+        else:
+            Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+        sources.append(buffer.getvalue())
+    return sources
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a non-empty list, `fraction` in 0.0-1.0."""
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def run_benchmarks(sources, functions, counts, platforms, repeats=3, padding=10, options=None, progress=None):
+    """
+    Time every function for every image count and platform.
+
+    Parameters:
+        sources (list): Image sources; the first `count` are used for each count.
+        functions (list): Names from BENCHMARKS.
+        counts (list): Image counts.
+        platforms (list): Names from SOCIAL_MEDIA_IMAGE_SIZES.
+        repeats (int): Timed runs per case.
+        padding (int): Space between images and canvas edges.
+        options (dict): quality/backend/workers passed to the collage functions.
+        progress (callable): Called with (done, total) after each case.
+
+    Returns:
+        dict: Function name -> list of {"count", "platform", "seconds"} samples.
+    """
+    options = options or {}
+    samples = {name: [] for name in functions}
+    total, done = len(functions) * len(counts) * len(platforms), 0
+    for name in functions:
+        for count in counts:
+            for target in platforms:
+                size = SOCIAL_MEDIA_IMAGE_SIZES[target]
+                for _ in range(repeats):
+                    # A cold tile cache, so every run decodes and fits like the first render of an upload
+                    TILE_CACHE.clear()
+                    canvas = Image.new("RGB", size, "#ffffff")
+                    start = time.perf_counter()
+                    BENCHMARKS[name](sources[:count], canvas, padding, options)
+                    samples[name].append({"count": count, "platform": target,
+                                          "seconds": time.perf_counter() - start})
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+    return samples
+
+
+def summarize(samples):
+    """
+    Reduce timing samples to per-function statistics.
+
+    Returns:
+        dict: Function name -> p50/p90/p99/max seconds, collages per second and output megapixels per second.
+    """
+    summary = {}
+    for name, runs in samples.items():
+        seconds = [run["seconds"] for run in runs]
+        if not seconds:
+            continue
+        pixels = sum(SOCIAL_MEDIA_IMAGE_SIZES[run["platform"]][0] * SOCIAL_MEDIA_IMAGE_SIZES[run["platform"]][1]
+                     for run in runs)
+        summary[name] = {
+            "runs": len(seconds),
+            "p50": percentile(seconds, 0.5),
+            "p90": percentile(seconds, 0.9),
+            "p99": percentile(seconds, 0.99),
+            "max": max(seconds),
+            "collages_per_second": len(seconds) / sum(seconds),
+            "megapixels_per_second": pixels / 1e6 / sum(seconds),
+        }
+    return summary
+
+
+def compare(summary, baseline, tolerance=0.1):
+    """
+    Compare p50 and p90 latencies with a baseline summary.
+
+    Returns:
+        list: (function, metric, baseline seconds, current seconds, ratio, regressed) rows.
+    """
+    rows = []
+    for name, current in summary.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("p50", "p90"):
+            ratio = current[metric] / previous[metric]
+            rows.append((name, metric, previous[metric], current[metric], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m collage.benchmark", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-f", "--function", action="append", choices=list(BENCHMARKS),
+                        help="Collage function to run, can be repeated (default: all)")
+    parser.add_argument("-n", "--count", action="append", type=int,
+                        help=f"Image count, can be repeated (default: {MIN_IMAGES}-{MAX_IMAGES})")
+    parser.add_argument("-p", "--platform", action="append", choices=list(SOCIAL_MEDIA_IMAGE_SIZES),
+                        help="Target size, can be repeated (default: all)")
+    parser.add_argument("--megapixels", type=float, default=12.0, help="Resolution of the synthetic sources")
+    parser.add_argument("--aspects", type=parse_aspects, default="4:3,3:4,1:1,16:9",
+                        help="Comma-separated aspect ratios of the sources, cycled through")
+    parser.add_argument("--png-share", type=float, default=0.0, help="Fraction of sources encoded as PNG")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic sources")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--padding", type=int, default=10, help=f"{MIN_PADDING}-{MAX_PADDING} px")
+    parser.add_argument("--quality", choices=RENDER_QUALITIES, default=RENDER_QUALITIES[0])
+    parser.add_argument("--backend", choices=RENDER_BACKENDS, default=RENDER_BACKENDS[0])
+    parser.add_argument("-j", "--workers", type=int, help="Decode workers (default: DEFAULT_WORKERS)")
+    parser.add_argument("--json", help="Also write the full results to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown before a regression")
+    args = parser.parse_args(argv)
+
+    if not MIN_PADDING <= args.padding <= MAX_PADDING:
+        parser.error(f"--padding must be between {MIN_PADDING} and {MAX_PADDING}")
+    args.function = args.function or list(BENCHMARKS)
+    args.count = args.count or list(range(MIN_IMAGES, MAX_IMAGES + 1))
+    args.platform = args.platform or list(SOCIAL_MEDIA_IMAGE_SIZES)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"Generating {max(args.count)} sources of {args.megapixels:g} MP", file=sys.stderr)
+    sources = synthetic_sources(max(args.count), args.megapixels, args.aspects, args.png_share, args.seed)
+
+    def progress(done, total):
+        print(f"\r[{done}/{total}]", end="", file=sys.stderr, flush=True)
+
+    options = {"quality": args.quality, "backend": args.backend, "workers": args.workers}
+    samples = run_benchmarks(sources, args.function, args.count, args.platform, args.repeats, args.padding, options,
+                             progress)
+    print(file=sys.stderr)
+    summary = summarize(samples)
+
+    print(f"{'function':<26} {'runs':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'collages/s':>11} {'MP/s':>8}")
+    for name, stats in summary.items():
+        print(f"{name:<26} {stats['runs']:>5} {stats['p50'] * 1000:>9.1f} {stats['p90'] * 1000:>9.1f} "
+              f"{stats['p99'] * 1000:>9.1f} {stats['collages_per_second']:>11.2f} "
+              f"{stats['megapixels_per_second']:>8.1f}")
+    rss = peak_rss()
+    if rss is not None:
+        print(f"Peak RSS: {rss / 2 ** 20:.0f} MB")
+
+    results = {
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("json", "baseline", "save_baseline", "tolerance")},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "summary": summary,
+        "peak_rss": rss,
+        "samples": samples,
+    }
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump({key: results[key] for key in ("settings", "machine", "summary", "peak_rss")}, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get("settings") != results["settings"]:
+        print("Note: the baseline was recorded with different settings", file=sys.stderr)
+
+    regressions = 0
+    print(f"\nAgainst {args.baseline}:")
+    for name, metric, previous, current, ratio, regressed in compare(summary, baseline["summary"], args.tolerance):
+        regressions += regressed
+        print(f"{name:<26} {metric} {previous * 1000:>9.1f} -> {current * 1000:>9.1f} ms ({ratio - 1:+.0%})"
+              f"{'  REGRESSION' if regressed else ''}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Headless batch rendering: python -m collage.cli SETS... -o OUTPUT"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .banded import banded_collage, check_canvas_size
+from .constants import (BAND_MEMORY_BYTES, DEFAULT_WORKERS, LAYOUTS, MAX_IMAGES, MAX_PADDING, MIN_IMAGES, MIN_PADDING,
+                        RENDER_QUALITIES, SOCIAL_MEDIA_IMAGE_SIZES)
+from .export import DEFAULT_COMPRESS_LEVEL, DEFAULT_EXPORT_QUALITY, EXPORT_FORMATS, encode_collage, slugify
+from .render import fanout_collages
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def read_image_sets(path):
+    """
+    Read image sets from a directory or a manifest file.
+
+    Parameters:
+        path (str): A directory (one set of the images it contains) or a JSON manifest. A manifest is a list
+            whose entries are either lists of image paths or {"name": ..., "images": [...]} objects; relative
+            paths are resolved against the manifest's directory.
+
+    Returns:
+        list: (name, image paths) pairs.
+    """
+    if os.path.isdir(path):
+        images = sorted(os.path.join(path, name) for name in os.listdir(path)
+                        if name.lower().endswith(IMAGE_EXTENSIONS))
+        return [(os.path.basename(os.path.normpath(path)), images)]
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    manifest_name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding="utf-8") as file:
+        manifest = json.load(file)
+
+    image_sets = []
+    for idx, entry in enumerate(manifest):
+        if isinstance(entry, dict):
+            name, images = entry.get("name", f"{manifest_name}-{idx}"), entry["images"]
+        else:
+            name, images = f"{manifest_name}-{idx}", entry
+        image_sets.append((name, [os.path.join(base_dir, image) for image in images]))
+    return image_sets
+
+
+def parse_size(value):
+    """Parse a custom canvas size like "12000x8000"."""
+    width, _, height = value.lower().partition("x")
+    try:
+        size = (int(width), int(height))
+        check_canvas_size(size)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r}, expected WIDTHxHEIGHT: {error}")
+    return size
+
+
+def render_job(job):
+    """
+    Render one image set with one layout to every pending target size. Runs in a worker process.
+
+    Parameters:
+        job (dict): Image paths, layout, pending outputs and render settings, see build_jobs().
+
+    Returns:
+        list: Paths of the written collages.
+    """
+    # Write under a temporary name first so an interrupted run never leaves a truncated collage behind
+    partial_paths = {target: output + ".part" for target, output in job["outputs"].items()}
+    sizes = {target: job["sizes"][target] for target in job["outputs"] if target in SOCIAL_MEDIA_IMAGE_SIZES}
+    # Every source is decoded once for all sizes. The process pool already keeps every core busy, so a job
+    # decodes serially.
+    collages = fanout_collages(job["images"], job["layout"], sizes, job["padding"], job["seed"] is not None,
+                               job["centered"], job["background"], job["quality"], backend="serial",
+                               seed=job["seed"]) if sizes else {}
+    for target, collage in collages.items():
+        with open(partial_paths[target], "wb") as file:
+            file.write(encode_collage(collage, job["format"], job["export_quality"], job["compress_level"]))
+
+    # Custom sizes are rendered in bands, straight into the file
+    for target in job["outputs"]:
+        if target not in sizes:
+            banded_collage(job["images"], job["layout"], job["sizes"][target], partial_paths[target],
+                           job["padding"], job["seed"] is not None, job["centered"], job["background"],
+                           job["quality"], job["compress_level"], job["memory_budget"], backend="serial",
+                           seed=job["seed"])
+
+    for target, output in job["outputs"].items():
+        os.replace(partial_paths[target], output)
+    return list(job["outputs"].values())
+
+
+def build_jobs(image_sets, args):
+    """Expand image sets x layouts into render jobs for the platforms whose collages aren't on disk yet."""
+    jobs, skipped = [], 0
+    targets = {platform: SOCIAL_MEDIA_IMAGE_SIZES[platform] for platform in args.platform}
+    targets.update((f"{width}x{height}", (width, height)) for width, height in args.size)
+    for name, images in image_sets:
+        if not MIN_IMAGES <= len(images) <= MAX_IMAGES:
+            print(f"Skipping {name}: {len(images)} images, expected {MIN_IMAGES}-{MAX_IMAGES}", file=sys.stderr)
+            continue
+
+        for layout in args.layout:
+            outputs = {}
+            for target in targets:
+                # Custom sizes are always PNG, see banded_collage()
+                extension = EXPORT_FORMATS[args.format if target in SOCIAL_MEDIA_IMAGE_SIZES else "PNG"][0]
+                output = os.path.join(args.output, name, f"{layout}-{slugify(target)}.{extension}")
+                if os.path.exists(output) and not args.force:
+                    skipped += 1
+                    continue
+                outputs[target] = output
+            if outputs:
+                jobs.append({
+                    "images": images,
+                    "layout": layout,
+                    "outputs": outputs,
+                    "sizes": {target: targets[target] for target in outputs},
+                    "padding": args.padding,
+                    "centered": args.centered,
+                    "seed": args.seed,
+                    "background": args.background,
+                    "quality": args.quality,
+                    "format": args.format,
+                    "export_quality": args.export_quality,
+                    "compress_level": args.compress_level,
+                    "memory_budget": int(args.memory_budget_mb * 2 ** 20),
+                })
+    return jobs, skipped
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render photo collages in batch, without the web UI.")
+    parser.add_argument("sets", nargs="+", help="Image set directories or JSON manifest files")
+    parser.add_argument("-o", "--output", required=True, help="Output directory, one subdirectory per set")
+    parser.add_argument("-l", "--layout", action="append", choices=LAYOUTS,
+                        help="Layout to render, can be repeated (default: auto)")
+    parser.add_argument("-p", "--platform", action="append", choices=list(SOCIAL_MEDIA_IMAGE_SIZES),
+                        help="Target size from the social media table, can be repeated (default: all, unless "
+                             "--size is given)")
+    parser.add_argument("-s", "--size", action="append", type=parse_size, default=[],
+                        help="Custom canvas size as WIDTHxHEIGHT, e.g. 12000x8000 for a poster. Rendered in bands "
+                             "and written as PNG; can be repeated")
+    parser.add_argument("--memory-budget-mb", type=float, default=BAND_MEMORY_BYTES / 2 ** 20,
+                        help="Memory a custom size render may use for its current band and decoded sources")
+    parser.add_argument("--padding", type=int, default=MIN_PADDING, help=f"{MIN_PADDING}-{MAX_PADDING} px")
+    parser.add_argument("--centered", action="store_true", help="Center images if possible")
+    parser.add_argument("--seed", type=int, help="Randomize image order, reproducibly")
+    parser.add_argument("--background", default="#ffffff", help="Background color")
+    parser.add_argument("--quality", choices=RENDER_QUALITIES, default=RENDER_QUALITIES[0])
+    parser.add_argument("--format", type=str.upper, choices=list(EXPORT_FORMATS), default="PNG")
+    parser.add_argument("--export-quality", "--jpeg-quality", type=int, default=DEFAULT_EXPORT_QUALITY,
+                        help="JPEG/WebP quality, 1-100")
+    parser.add_argument("--compress-level", type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        metavar="0-9", help="PNG zlib level, scaled for WebP")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help="Worker processes")
+    parser.add_argument("--force", action="store_true", help="Re-render collages that already exist")
+    args = parser.parse_args(argv)
+
+    if not MIN_PADDING <= args.padding <= MAX_PADDING:
+        parser.error(f"--padding must be between {MIN_PADDING} and {MAX_PADDING}")
+    if not 1 <= args.export_quality <= 100:
+        parser.error("--export-quality must be between 1 and 100")
+    args.layout = args.layout or ["auto"]
+    args.platform = args.platform or ([] if args.size else list(SOCIAL_MEDIA_IMAGE_SIZES))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    image_sets = []
+    for path in args.sets:
+        image_sets.extend(read_image_sets(path))
+    jobs, skipped = build_jobs(image_sets, args)
+    for job in jobs:
+        for output in job["outputs"].values():
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    total = sum(len(job["outputs"]) for job in jobs)
+    print(f"{total} collages to render, {skipped} already done", file=sys.stderr)
+
+    failures = 0
+    done = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(render_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+                status = "ok"
+            except Exception as error:
+                failures += len(job["outputs"])
+                status = f"failed: {error}"
+            for output in job["outputs"].values():
+                done += 1
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{total}] {output} {status} ({done / elapsed:.1f} collages/s)", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Limits, defaults and target sizes shared by the engine and its front ends."""
+import math
+import os
+import tempfile
+
+GOLDEN_RATIO = (1 + math.sqrt(5)) / 2  # Define the golden ratio
+
+MIN_IMAGES = 4
+MAX_IMAGES = 20
+
+MIN_PADDING = 0
+MAX_PADDING = 50
+
+# Render quality settings: "quality" keeps headroom for a LANCZOS resample, "fast" decodes close to the target size
+RENDER_QUALITIES = ("quality", "fast")
+
+# Execution backends for decoding and fitting tiles; Pillow releases the GIL while decoding and resampling
+RENDER_BACKENDS = ("thread", "process", "serial")
+DEFAULT_WORKERS = min(MAX_IMAGES, os.cpu_count() or 1)
+
+# Memory budget of the fitted tile cache
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Disk budget of the shared decode cache (see collage.decode_cache), and where front ends keep it by default: one
+# directory per user, since the temp directory is shared between users on POSIX systems
+DECODE_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+DECODE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "photo-collage-decode-cache"
+                                + (f"-{os.getuid()}" if hasattr(os, "getuid") else ""))
+
+# Custom canvases (see collage.banded): longest side, the default memory budget of a banded render and its
+# thinnest band
+MAX_CANVAS_SIDE = 32768
+BAND_MEMORY_BYTES = 256 * 1024 * 1024
+MIN_BAND_ROWS = 16
+
+# Longest side of the on-screen preview, and of the cached proxies it is composited from
+PREVIEW_SIZE = 800
+PROXY_SIZE = 1024
+
+# Variant generation: most arrangements generated at once, and the longest side of each contact sheet thumbnail
+MAX_VARIANTS = 16
+THUMBNAIL_SIZE = 240
+
+LAYOUTS = ("grid", "strip", "stack", "golden_ratio", "justified", "auto", "search")
+
+# Layout search: image orders tried per candidate geometry, and the weights of its score terms (see collage.search)
+SEARCH_SAMPLES = 256
+SEARCH_WEIGHTS = {"crop": 1.0, "upscale": 0.5, "unused": 1.0}
+
+# Provided data for social media sizes
+SOCIAL_MEDIA_IMAGE_SIZES = {
+    "Instagram Feed Square": (1080, 1080),
+    "Instagram Feed Portrait": (1080, 1350),
+    "Instagram Feed Landscape": (1080, 608),
+    "Instagram Stories/Reels": (1080, 1920),
+    "Facebook Feed Post": (1200, 630),
+    "Facebook Stories": (1080, 1920),
+    "Facebook Event Cover": (1920, 1005),
+    "YouTube Thumbnail": (1280, 720),
+    "YouTube Channel Art": (2560, 1440),
+    "X Single Image": (1200, 675),
+    "X Multi-Image": (1200, 600),
+    "LinkedIn Feed Post": (1200, 627),
+    "LinkedIn Company Cover": (1128, 191),
+}
+
+# No tile is longer than the largest canvas side, and fit_crop scales a source until it covers its tile, often
+# keeping the source's short side whole. Normalized uploads keep their short side up to this bound, so a
+# tile is never upscaled beyond what the original would have given
+MAX_SOURCE_SIDE = max(max(size) for size in SOCIAL_MEDIA_IMAGE_SIZES.values())
+NORMALIZED_QUALITY = 92
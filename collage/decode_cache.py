@@ -0,0 +1,259 @@
+"""
+Disk-backed cache of decoded sources, shared by every session, thread and worker process on a machine.
+
+Decoded pixels are stored as raw RGBX rows, the layout Pillow keeps RGB images in, so a hit is memory-mapped and
+handed to Pillow without decoding or copying. Entries are keyed by content hash and decoded size, one directory
+per source; a source decoded at a larger size serves every smaller request.
+"""
+import logging
+import mmap
+import os
+import stat
+import tempfile
+import threading
+
+from PIL import Image
+
+from .constants import DECODE_CACHE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Set to a cache directory to enable the cache in this process and in worker processes it starts; the budget
+# defaults to DECODE_CACHE_BYTES
+DECODE_CACHE_ENV = "COLLAGE_DECODE_CACHE"
+DECODE_CACHE_BYTES_ENV = "COLLAGE_DECODE_CACHE_BYTES"
+
+_SUFFIX = ".rgbx"
+
+# Modes stored without losing information; palette and alpha images are decoded every time
+CACHED_MODES = ("RGB", "L")
+
+# A process rescans the directory for entries other processes added after writing this share of the budget,
+# which bounds how far they push the cache over it together
+RESCAN_SHARE = 8
+
+
+def _entry_name(size):
+    return f"{size[0]}x{size[1]}{_SUFFIX}"
+
+
+def _entry_size(name):
+    # "<width>x<height>.rgbx" -> (width, height)
+    width, _, height = name[:-len(_SUFFIX)].partition("x")
+    return int(width), int(height)
+
+
+def _check_private(directory):
+    # Entries are mapped straight into renders, so nobody else may be able to plant them, e.g. by creating a
+    # predictable directory under a shared temp directory first
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Decode cache {directory} is not a directory.")
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        raise PermissionError(f"Decode cache {directory} must be owned by this user and writable by nobody else.")
+
+
+class DecodeCache:
+    """
+    LRU cache of decoded images in a directory, bounded by the bytes its files occupy.
+
+    Safe to share between threads and processes: entries are written to a temporary file and renamed into place,
+    so readers never see a partial entry, and an entry evicted while mapped stays readable until it is unmapped.
+    Recency is the file modification time, refreshed on every hit. Lookups only list the directory of one source;
+    the whole cache is scanned for eviction once this process's writes may have filled it.
+
+    Raises:
+        PermissionError: If the directory is not owned by this user or others can write to it.
+    """
+
+    def __init__(self, directory, max_bytes=DECODE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Bytes in the cache as of the last scan plus those this process wrote since, and the latter alone
+        self._bytes = 0
+        self._written = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _check_private(directory)
+        # A smaller budget than the directory was filled with applies right away
+        self._evict()
+
+    def _source_entries(self, digest):
+        # (path, size, bytes, mtime) of every complete entry of one source
+        entries = []
+        try:
+            with os.scandir(os.path.join(self.directory, digest)) as scan:
+                for entry in scan:
+                    if not entry.name.endswith(_SUFFIX):
+                        continue
+                    try:
+                        info = entry.stat()
+                        size = _entry_size(entry.name)
+                    except (OSError, ValueError):
+                        continue
+                    entries.append((entry.path, size, info.st_size, info.st_mtime))
+        except OSError:
+            # Not cached, or evicted by another process while listed
+            pass
+        return entries
+
+    def _entries(self):
+        # (path, digest, size, bytes, mtime) of every complete entry
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.extend((path, entry.name, size, length, mtime)
+                                   for path, size, length, mtime in self._source_entries(entry.name))
+        return entries
+
+    def get(self, digest, min_size):
+        """
+        Map the smallest cached decode of a source that is at least `min_size`.
+
+        Parameters:
+            digest (str): content_hash of the source.
+            min_size (tuple): Smallest acceptable (width, height).
+
+        Returns:
+            PIL.Image: Read-only RGBX image backed by the cache file, or None.
+        """
+        candidates = sorted((size[0] * size[1], path, size) for path, size, _, _ in self._source_entries(digest)
+                            if size[0] >= min_size[0] and size[1] >= min_size[1])
+        for _, path, size in candidates:
+            img = self._map(path, size)
+            if img is not None:
+                with self._lock:
+                    self.hits += 1
+                return img
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _map(self, path, size):
+        try:
+            with open(path, "rb") as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Evicted by another process since the directory was listed, or an empty file
+            return None
+        if len(buffer) != size[0] * size[1] * 4:
+            logger.warning("Discarding damaged decode cache entry %s", path)
+            buffer.close()
+            self._remove(path)
+            return None
+        return Image.frombuffer("RGBX", size, buffer, "raw", "RGBX", 0, 1)
+
+    def put(self, digest, img):
+        """
+        Store a decoded image and evict the least recently used entries until the cache fits its budget.
+
+        Parameters:
+            digest (str): content_hash of the source.
+            img (PIL.Image): Decoded image; only CACHED_MODES are stored.
+
+        Returns:
+            bool: Whether the image was stored.
+        """
+        if img.mode not in CACHED_MODES or img.width * img.height * 4 > self.max_bytes:
+            return False
+        source_directory = os.path.join(self.directory, digest)
+        path = os.path.join(source_directory, _entry_name(img.size))
+        if os.path.exists(path):
+            return True
+
+        temporary = None
+        try:
+            os.makedirs(source_directory, mode=0o700, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=source_directory, suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(img.convert("RGBX").tobytes())
+            os.replace(temporary, path)
+        except OSError:
+            # Also when another process removed the source's directory in the meantime
+            logger.warning("Could not write decode cache entry %s", path, exc_info=True)
+            if temporary is not None:
+                self._remove(temporary)
+            return False
+        with self._lock:
+            self._bytes += img.width * img.height * 4
+            self._written += img.width * img.height * 4
+            full = self._bytes > self.max_bytes or self._written > self.max_bytes // RESCAN_SHARE
+        if full:
+            self._evict()
+        return True
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[4])
+        total = sum(entry[3] for entry in entries)
+        for path, _, _, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            # Another process may be evicting the same entry; either way it no longer counts
+            self._remove(path)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._bytes, self._written = total, 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            # Drops the source's directory with its last entry; fails while it holds others
+            if os.path.dirname(path) != self.directory:
+                os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+    def clear(self):
+        for path, _, _, _, _ in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._bytes, self._written = 0, 0
+
+    def stats(self):
+        """Return this process's hit/miss/eviction counters and the cache's current usage."""
+        entries = self._entries()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(entry[3] for entry in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+
+DECODE_CACHE = None
+if os.environ.get(DECODE_CACHE_ENV):
+    DECODE_CACHE = DecodeCache(os.environ[DECODE_CACHE_ENV],
+                               int(os.environ.get(DECODE_CACHE_BYTES_ENV, DECODE_CACHE_BYTES)))
+
+
+def configure_decode_cache(directory, max_bytes=DECODE_CACHE_BYTES):
+    """
+    Enable the shared decode cache, or disable it with directory=None.
+
+    The setting is also exported through the COLLAGE_DECODE_CACHE(_BYTES) environment variables, so worker
+    processes started afterwards use the same cache.
+
+    Returns:
+        DecodeCache: The active cache, or None.
+    """
+    global DECODE_CACHE
+    if directory is None:
+        DECODE_CACHE = None
+        os.environ.pop(DECODE_CACHE_ENV, None)
+        os.environ.pop(DECODE_CACHE_BYTES_ENV, None)
+        return None
+    if DECODE_CACHE is None or DECODE_CACHE.directory != directory or DECODE_CACHE.max_bytes != max_bytes:
+        DECODE_CACHE = DecodeCache(directory, max_bytes)
+    os.environ[DECODE_CACHE_ENV] = directory
+    os.environ[DECODE_CACHE_BYTES_ENV] = str(max_bytes)
+    return DECODE_CACHE
@@ -0,0 +1,155 @@
+"""Encoding finished collages for download and writing them out."""
+import io
+import struct
+import zipfile
+import zlib
+
+from .profiling import timed
+
+# Pillow format name -> file extension and MIME type
+EXPORT_FORMATS = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+    "PNG": ("png", "image/png"),
+}
+
+DEFAULT_EXPORT_QUALITY = 90
+DEFAULT_COMPRESS_LEVEL = 6
+
+# Rows filtered and compressed at a time by PngWriter
+PNG_CHUNK_ROWS = 64
+
+
+def slugify(name):
+    """Turn a platform name like "Instagram Stories/Reels" into "instagram-stories-reels"."""
+    return "-".join("".join(char if char.isalnum() else " " for char in name.lower()).split())
+
+
+def encode_collage(collage, format="JPEG", quality=DEFAULT_EXPORT_QUALITY, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """
+    Encode a collage for download.
+
+    Parameters:
+        collage (PIL.Image): Rendered collage.
+        format (str): One of EXPORT_FORMATS.
+        quality (int): JPEG/WebP quality, 1-100.
+        compress_level (int): Encoder effort, 0-9: zlib level for PNG, scaled to WebP's 0-6 method.
+
+    Returns:
+        bytes: Encoded image.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(EXPORT_FORMATS)}.")
+
+    buffer = io.BytesIO()
+    with timed("encode", target_size=collage.size) as measured:
+        if format == "PNG":
+            collage.save(buffer, format="PNG", compress_level=compress_level)
+        elif format == "WEBP":
+            collage.save(buffer, format="WEBP", quality=quality, method=round(compress_level * 6 / 9))
+        else:
+            collage.convert("RGB").save(buffer, format="JPEG", quality=quality)
+        measured["bytes"] = buffer.tell()
+    return buffer.getvalue()
+
+
+def zip_collages(collages, prefix="collage", format="PNG", quality=DEFAULT_EXPORT_QUALITY,
+                 compress_level=DEFAULT_COMPRESS_LEVEL):
+    """
+    Pack several collages into one zip archive.
+
+    Parameters:
+        collages (dict): Target name -> collage, as returned by fanout_collages().
+        prefix (str): File name prefix inside the archive.
+        format (str): One of EXPORT_FORMATS.
+        quality (int): JPEG/WebP quality, 1-100.
+        compress_level (int): Encoder effort, 0-9.
+
+    Returns:
+        bytes: Zip archive with one "<prefix>-<target>.<ext>" file per collage.
+    """
+    extension = EXPORT_FORMATS[format][0]
+    buffer = io.BytesIO()
+    # Encoded images don't deflate any further, so they're stored as they are
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, collage in collages.items():
+            archive.writestr(f"{prefix}-{slugify(name)}.{extension}",
+                             encode_collage(collage, format, quality, compress_level))
+    return buffer.getvalue()
+
+
+class PngWriter:
+    """
+    Stream an RGB PNG to a file band by band, so the whole image never has to be in memory.
+
+    Rows are Paeth-filtered and deflated as they arrive. Use as a context manager, or call close() after the last
+    band; the image is complete once exactly `size[1]` rows were written.
+    """
+
+    def __init__(self, file, size, compress_level=DEFAULT_COMPRESS_LEVEL):
+        # Imported here so encoding PIL collages never pulls in NumPy
+        import numpy as np
+
+        self._np = np
+        self._file = file
+        self.size = tuple(size)
+        self.rows = 0
+        self._compressor = zlib.compressobj(compress_level)
+        # The row above the first one counts as black
+        self._previous = np.zeros(self.size[0] * 3, dtype=np.uint8)
+        file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, truecolor, deflate, adaptive filtering, no interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", self.size[0], self.size[1], 8, 2, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack(">I", len(data)) + kind + data
+                         + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, band):
+        """Append the rows of a band: a PIL image or (rows, width, 3) uint8 array as wide as the PNG."""
+        np = self._np
+        pixels = np.asarray(band if isinstance(band, np.ndarray) or band.mode == "RGB" else band.convert("RGB"))
+        if pixels.shape[1] != self.size[0] or self.rows + pixels.shape[0] > self.size[1]:
+            raise ValueError(f"Band of {pixels.shape[1]}x{pixels.shape[0]} doesn't fit the remaining rows of a "
+                             f"{self.size[0]}x{self.size[1]} PNG.")
+
+        with timed("encode", target_size=pixels.shape[1::-1]) as measured:
+            pixels = pixels.reshape(pixels.shape[0], -1)
+            for start in range(0, len(pixels), PNG_CHUNK_ROWS):
+                data = self._compressor.compress(self._paeth(pixels[start:start + PNG_CHUNK_ROWS]))
+                if data:
+                    self._chunk(b"IDAT", data)
+                    measured["bytes"] = measured.get("bytes", 0) + len(data)
+            self.rows += len(pixels)
+
+    def _paeth(self, rows):
+        # PNG filter type 4: each byte minus the one of its left, upper and upper-left neighbours closest to
+        # left + upper - upper-left. The prediction only uses unfiltered bytes, so whole rows are filtered at once
+        np = self._np
+        current = rows.astype(np.int16)
+        up = np.vstack([self._previous[None], rows[:-1]]).astype(np.int16)
+        left = np.zeros_like(current)
+        left[:, 3:] = current[:, :-3]
+        up_left = np.zeros_like(current)
+        up_left[:, 3:] = up[:, :-3]
+        pa, pb, pc = np.abs(up - up_left), np.abs(left - up_left), np.abs(left + up - 2 * up_left)
+        prediction = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+        self._previous = rows[-1]
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 4
+        filtered[:, 1:] = (current - prediction).astype(np.uint8)
+        return filtered.tobytes()
+
+    def close(self):
+        """Finish the PNG; raises ValueError if rows are missing."""
+        if self.rows != self.size[1]:
+            raise ValueError(f"PNG has {self.rows} of {self.size[1]} rows.")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
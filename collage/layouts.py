@@ -0,0 +1,503 @@
+"""Geometry-only layout planning. Nothing here decodes or touches pixels."""
+import logging
+import math
+import random
+from collections import namedtuple
+
+from .constants import GOLDEN_RATIO, LAYOUTS, PREVIEW_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+# Geometry-only placement of one source on the canvas. `index` points into the image list, `crop` is the
+# (left, top, right, bottom) box of the source to keep, as fractions of its width and height.
+Placement = namedtuple("Placement", ["index", "x", "y", "width", "height", "crop"])
+
+
+def aspect_class(size):
+    """Classify a (width, height) pair as "square", "horizontal" or "vertical"."""
+    width, height = size
+    if width == height:
+        return "square"
+    return "vertical" if height > width else "horizontal"
+
+
+def fit_crop(source_size, size, centering=(0.5, 0.5)):
+    """
+    Compute the crop box ImageOps.fit would use, independent of the source resolution.
+
+    Parameters:
+        source_size (tuple): Source (width, height).
+        size (tuple): Target (width, height).
+        centering (tuple): Horizontal and vertical crop centering, 0.0-1.0.
+
+    Returns:
+        tuple: (left, top, right, bottom) as fractions of the source width and height.
+    """
+    source_ratio = source_size[0] / source_size[1]
+    target_ratio = size[0] / size[1]
+    if source_ratio >= target_ratio:
+        crop_width, crop_height = target_ratio / source_ratio, 1.0
+    else:
+        crop_width, crop_height = 1.0, source_ratio / target_ratio
+    left = (1 - crop_width) * centering[0]
+    top = (1 - crop_height) * centering[1]
+    return left, top, left + crop_width, top + crop_height
+
+
+def scale_plan(plan, scale):
+    """
+    Scale a placement plan to another canvas resolution. Crop boxes are resolution independent.
+
+    Parameters:
+        plan (list): Placement tuples.
+        scale (float): Factor applied to positions and tile sizes.
+
+    Returns:
+        list: Scaled Placement tuples.
+    """
+    return [
+        placement._replace(x=round(placement.x * scale), y=round(placement.y * scale),
+                           width=max(1, round(placement.width * scale)),
+                           height=max(1, round(placement.height * scale)))
+        for placement in plan
+    ]
+
+
+def preview_scale(canvas_size, max_side=PREVIEW_SIZE):
+    """Return the factor that fits a canvas into the preview size (never upscales)."""
+    return min(1.0, max_side / max(canvas_size))
+
+
+def plan_golden_ratio(sizes, canvas_size, padding, horizontal_order="right-to-left", vertical_order="bottom-to-top"):
+    """
+    Plan a golden ratio-based collage.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images.
+        horizontal_order (str): Side of the first horizontal split: "right-to-left" or "left-to-right".
+        vertical_order (str): Side of the first vertical split: "bottom-to-top" or "top-to-bottom".
+
+    Returns:
+        list: Placement tuples.
+
+    Notes:
+        - Each image takes a golden ratio share of the remaining working area.
+    """
+    # Initialize the working area for placing images
+    working_area = {
+        "x": 0,
+        "y": 0,
+        "width": canvas_size[0],
+        "height": canvas_size[1],
+    }
+
+    plan = []
+    x, y = 0, 0  # Starting position
+    for idx, source_size in enumerate(sizes):
+        # Decide whether to split horizontally or vertically based on working area dimensions
+        if working_area["width"] > working_area["height"]:  # Horizontal split
+            tile_width, tile_height = int(working_area["width"] / GOLDEN_RATIO), working_area["height"]
+            # Adjust position and update working area
+            if horizontal_order == "right-to-left":
+                horizontal_order = "left-to-right"
+                working_area["x"] += tile_width + padding
+            else:
+                x = x + working_area["width"] - tile_width
+                horizontal_order = "right-to-left"
+            working_area["width"] -= tile_width + padding
+        else:  # Vertical split
+            tile_width, tile_height = working_area["width"], int(working_area["height"] / GOLDEN_RATIO)
+            # Adjust position and update working area
+            if vertical_order == "bottom-to-top":
+                working_area["y"] += tile_height + padding
+                vertical_order = "top-to-bottom"
+            else:
+                y = y + working_area["height"] - tile_height
+                vertical_order = "bottom-to-top"
+            working_area["height"] -= tile_height + padding
+
+        # Stop before a tile that has no room left, e.g. many images with a large padding
+        if tile_width <= 0 or tile_height <= 0:
+            logger.info("Working area exhausted after %d of %d images. Stopping collage creation.", idx,
+                        len(sizes))
+            break
+        plan.append(Placement(idx, x, y, tile_width, tile_height, fit_crop(source_size, (tile_width, tile_height))))
+        x, y = working_area["x"], working_area["y"]  # Update position for the next image
+
+        # Stop if the working area becomes too small
+        if working_area["width"] <= 0 or working_area["height"] <= 0:
+            logger.info("Working area exhausted after %d of %d images. Stopping collage creation.", idx + 1,
+                        len(sizes))
+            break
+
+    return plan
+
+
+def plan_grid(sizes, canvas_size, padding, centered):
+    """
+    Plan a grid-based collage.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Whether to center the grid if the canvas is not square.
+
+    Returns:
+        list: Placement tuples.
+    """
+    images_num = len(sizes)
+    canvas_width, canvas_height = canvas_size
+    if canvas_width == canvas_height:
+        # Square canvas: Determine grid dimensions for a square layout
+        cols = grid_size = math.ceil(math.sqrt(images_num))
+        cell_width = cell_height = (canvas_width - (grid_size + 1) * padding) // grid_size
+        offset_x, offset_y = 0, 0
+
+    else:
+        # Non-square canvas: Determine grid dimensions for the closest layout
+        cols = math.ceil(math.sqrt(images_num))
+        rows = math.ceil(images_num / cols)
+        offset_x, offset_y = 0, 0
+
+        # Adjust grid dimensions and offsets based on canvas proportions
+        if canvas_width > canvas_height:
+            if cols < rows:
+                cols, rows = rows, cols
+            if centered:
+                offset_x = (canvas_width - (rows * (canvas_height // rows))) // 2
+        elif canvas_width < canvas_height:
+            if cols > rows:
+                cols, rows = rows, cols
+            if centered:
+                offset_y = (canvas_height - (cols * (canvas_width // cols))) // 2
+
+        # Calculate cell dimensions
+        cell_width = (canvas_width - (cols + 1) * padding) // cols
+        cell_height = (canvas_height - (rows + 1) * padding) // rows
+
+        # Use the smaller dimension if centering is enabled
+        if centered:
+            cell_width = cell_height = min(cell_width, cell_height)
+
+    plan = []
+    for idx, source_size in enumerate(sizes):
+        # Calculate position in the grid
+        x = (idx % cols) * (cell_width + padding) + padding + offset_x
+        y = (idx // cols) * (cell_height + padding) + padding + offset_y
+
+        plan.append(Placement(idx, x, y, cell_width, cell_height, fit_crop(source_size, (cell_width, cell_height))))
+
+    return plan
+
+
+def plan_lane(sizes, canvas_size, padding, centered, orientation="horizontal"):
+    """
+    Plan a lane-based collage.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Whether to center the lanes on the canvas.
+        orientation (str): Orientation of the lanes: "horizontal" or "vertical".
+
+    Returns:
+        list: Placement tuples.
+    """
+    canvas_width, canvas_height = canvas_size
+
+    images_num = len(sizes)
+
+    # Determine block size based on orientation
+    if orientation == "horizontal":
+        block_height = (canvas_height - (images_num + 1) * padding) // images_num
+        block_width = canvas_width
+    elif orientation == "vertical":
+        block_width = (canvas_width - (images_num + 1) * padding) // images_num
+        block_height = canvas_height
+    else:
+        raise ValueError("Orientation must be 'horizontal' or 'vertical'.")
+    if block_width <= 0 or block_height <= 0:
+        logger.info("No room for %d lanes with a padding of %d px.", images_num, padding)
+        return []
+
+    # Centering offsets
+    offset_x, offset_y = 0, 0
+    if centered:
+        if orientation == "horizontal" and images_num * (block_height + padding) < canvas_height:
+            offset_y = (canvas_height - (images_num * (block_height + padding))) // 2
+        if orientation == "vertical" and images_num * (block_width + padding) < canvas_width:
+            offset_x = (canvas_width - (images_num * (block_width + padding))) // 2
+
+    plan = []
+    for idx, source_size in enumerate(sizes):
+        # Calculate position
+        x, y = 0, 0
+        if orientation == "horizontal":
+            y = idx * (block_height + padding) + padding + offset_y
+        elif orientation == "vertical":
+            x = idx * (block_width + padding) + padding + offset_x
+
+        plan.append(Placement(idx, x, y, block_width, block_height, fit_crop(source_size, (block_width, block_height))))
+
+    return plan
+
+
+def _partition(weights, parts):
+    """
+    Split a sequence into contiguous groups whose sums are as even as possible.
+
+    Parameters:
+        weights (list): Non-negative weights, in order.
+        parts (int): Number of groups, 1-len(weights).
+
+    Returns:
+        list: Lists of indexes into `weights`, one per group.
+
+    Notes:
+        - Dynamic programming over prefix sums, minimizing the squared deviation of every group from the mean.
+    """
+    count = len(weights)
+    prefix = [0.0]
+    for weight in weights:
+        prefix.append(prefix[-1] + weight)
+    target = prefix[-1] / parts
+
+    # cost[j][i]: best cost of splitting the first i weights into j groups, split[j][i]: where the last group starts
+    cost = [[math.inf] * (count + 1) for _ in range(parts + 1)]
+    split = [[0] * (count + 1) for _ in range(parts + 1)]
+    cost[0][0] = 0.0
+    for group in range(1, parts + 1):
+        for end in range(group, count - parts + group + 1):
+            for start in range(group - 1, end):
+                candidate = cost[group - 1][start] + (prefix[end] - prefix[start] - target) ** 2
+                if candidate < cost[group][end]:
+                    cost[group][end], split[group][end] = candidate, start
+
+    groups, end = [], count
+    for group in range(parts, 0, -1):
+        start = split[group][end]
+        groups.append(list(range(start, end)))
+        end = start
+    return groups[::-1]
+
+
+def _justify_rows(aspects, canvas_size, padding, centered):
+    """
+    Pack images into full-width rows of equal height, picking the row count that needs the least stretching.
+
+    Parameters:
+        aspects (list): Source width / height ratios, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Keep every image uncropped and center the block instead of filling the canvas.
+
+    Returns:
+        tuple: (boxes, distortion), where boxes are (index, x, y, width, height) tuples and distortion is the
+        absolute log of the vertical stretch needed to fill the canvas; None if nothing fits.
+    """
+    canvas_width, canvas_height = canvas_size
+    images_num = len(aspects)
+
+    # k rows of aspect sum T / k each are k * W / T tall, so k = sqrt(T * H / W) rows fill the canvas
+    estimate = math.sqrt(sum(aspects) * canvas_height / canvas_width)
+    best = None
+    for rows in {math.floor(estimate) - 1, math.floor(estimate), math.ceil(estimate), math.ceil(estimate) + 1}:
+        if not 1 <= rows <= images_num:
+            continue
+        groups = _partition(aspects, rows)
+        # Height of each row when its images keep their aspect ratio and span the canvas width
+        heights = [(canvas_width - (len(group) + 1) * padding) / sum(aspects[idx] for idx in group)
+                   for group in groups]
+        available = canvas_height - (rows + 1) * padding
+        if available <= 0 or min(heights) <= 0:
+            continue
+        stretch = available / sum(heights)
+        distortion = abs(math.log(stretch))
+        if best is None or distortion < best[0]:
+            best = (distortion, groups, heights, stretch, available)
+    if best is None:
+        return None
+    distortion, groups, heights, stretch, available = best
+
+    # Filling the canvas stretches every row by the same factor and crops to match. Centering scales the rows
+    # instead (never up), so nothing is cropped and the block sits in the middle of the canvas
+    scale = min(1.0, stretch) if centered else 1.0
+    offset_y = (available - sum(heights) * scale) / 2 if centered else 0
+
+    boxes = []
+    top = offset_y + padding
+    for group, height in zip(groups, heights):
+        row_height = height * (scale if centered else stretch)
+        y, bottom = round(top), round(top + row_height)
+        left = padding + (1 - scale) * (canvas_width - (len(group) + 1) * padding) / 2
+        for idx in group:
+            # Place by cumulative edges so rounding never leaves a gap or overshoots the row
+            right = left + aspects[idx] * height * scale
+            x = round(left)
+            boxes.append((idx, x, y, max(1, round(right) - x), max(1, bottom - y)))
+            left = right + padding
+        top += row_height + padding
+    return boxes, distortion
+
+
+def plan_justified(sizes, canvas_size, padding, centered, orientation=None):
+    """
+    Plan a justified collage: images keep their order and are packed into rows (or columns) of even length.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Keep every image uncropped and center the collage instead of filling the canvas.
+        orientation (str): "horizontal" for rows, "vertical" for columns, None to pick whichever crops less.
+
+    Returns:
+        list: Placement tuples.
+
+    Notes:
+        - Only source sizes are needed, so planning works from image headers alone.
+        - Every image in a row shares one height, so crops stay small even for mixed aspect ratios.
+    """
+    canvas_width, canvas_height = canvas_size
+    candidates = []
+    if orientation in (None, "horizontal"):
+        rows = _justify_rows([width / height for width, height in sizes], canvas_size, padding, centered)
+        if rows is not None:
+            candidates.append((rows[1], rows[0]))
+    if orientation in (None, "vertical"):
+        # Columns are rows of the transposed canvas
+        columns = _justify_rows([height / width for width, height in sizes], (canvas_height, canvas_width),
+                                padding, centered)
+        if columns is not None:
+            candidates.append((columns[1], [(idx, y, x, height, width) for idx, x, y, width, height in columns[0]]))
+    if orientation not in (None, "horizontal", "vertical"):
+        raise ValueError("Orientation must be 'horizontal', 'vertical' or None.")
+    if not candidates:
+        return []
+
+    _, boxes = min(candidates, key=lambda candidate: candidate[0])
+    return [Placement(idx, x, y, width, height, fit_crop(sizes[idx], (width, height)))
+            for idx, x, y, width, height in boxes]
+
+
+def plan_auto(sizes, canvas_size, padding, centered, horizontal_order="right-to-left",
+              vertical_order="bottom-to-top"):
+    """
+    Plan an auto layout: pick the layout that suits the image orientations and plan it.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        horizontal_order (str): Kept for compatibility; mixed sets use the justified layout.
+        vertical_order (str): Kept for compatibility; mixed sets use the justified layout.
+
+    Returns:
+        list: Placement tuples.
+    """
+    images_num = len(sizes)
+    squares = 0
+    horizontal_rectangles = 0
+    vertical_rectangles = 0
+    for width, height in sizes:
+        if height == width:
+            squares += 1
+
+        elif height > width:
+            vertical_rectangles += 1
+
+        else:
+            horizontal_rectangles += 1
+
+    if squares == images_num:
+        return plan_grid(sizes, canvas_size, padding, centered)
+
+    elif horizontal_rectangles == images_num:
+        return plan_lane(sizes, canvas_size, padding, centered, orientation="horizontal")
+
+    elif vertical_rectangles == images_num:
+        return plan_lane(sizes, canvas_size, padding, centered, orientation="vertical")
+
+    else:
+        # Mixed orientations: justified rows or columns crop far less than fixed cells
+        return plan_justified(sizes, canvas_size, padding, centered) or plan_golden_ratio(
+            sizes, canvas_size, padding, horizontal_order, vertical_order)
+
+
+def _random_orders(rng=random):
+    return rng.choice(["right-to-left", "left-to-right"]), rng.choice(["bottom-to-top", "top-to-bottom"])
+
+
+def plan_layout(layout, sizes, canvas_size, padding, randomization=False, centered=False, rng=None):
+    """
+    Plan any of the named layouts without touching pixels.
+
+    Parameters:
+        layout (str): One of LAYOUTS.
+        sizes (list): Source (width, height) pairs.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        rng (random.Random): Source of randomness, e.g. random.Random(seed) for a reproducible arrangement
+            (default: the global `random` state).
+
+    Returns:
+        list: Placement tuples; indexes point into `sizes`, which is left untouched.
+    """
+    rng = rng or random
+    order = list(range(len(sizes)))
+    horizontal_order = "right-to-left"
+    vertical_order = "bottom-to-top"
+    if randomization:
+        horizontal_order, vertical_order = _random_orders(rng)
+        rng.shuffle(order)
+    ordered_sizes = [sizes[idx] for idx in order]
+
+    match layout:
+        case "golden_ratio":
+            plan = plan_golden_ratio(ordered_sizes, canvas_size, padding, horizontal_order, vertical_order)
+        case "grid":
+            plan = plan_grid(ordered_sizes, canvas_size, padding, centered)
+        case "strip":
+            plan = plan_lane(ordered_sizes, canvas_size, padding, centered, orientation="vertical")
+        case "stack":
+            plan = plan_lane(ordered_sizes, canvas_size, padding, centered, orientation="horizontal")
+        case "justified":
+            plan = plan_justified(ordered_sizes, canvas_size, padding, centered)
+        case "auto":
+            plan = plan_auto(ordered_sizes, canvas_size, padding, centered, horizontal_order, vertical_order)
+        case "search":
+            # Imported here so the other layouts never pull in NumPy
+            from .search import search_layout
+            # Fixed seed unless randomized; drawn from `random` so callers replaying its state get the same plan
+            plan = search_layout(ordered_sizes, canvas_size, padding, centered,
+                                 seed=rng.getrandbits(64) if randomization else 0)
+        case _:
+            raise ValueError(f"Layout must be one of {', '.join(LAYOUTS)}.")
+
+    return [placement._replace(index=order[placement.index]) for placement in plan]
+
+
+def plan_variants(layout, sizes, canvas_size, padding, seeds, centered=False):
+    """
+    Plan one randomized arrangement per seed; the same seed always gives the same plan.
+
+    Parameters:
+        layout (str): One of LAYOUTS.
+        sizes (list): Source (width, height) pairs.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        seeds (list): Integer seeds, one per variant.
+        centered (bool): Whether to center the grid if the canvas is not square.
+
+    Returns:
+        list: One list of Placement tuples per seed.
+    """
+    return [plan_layout(layout, sizes, canvas_size, padding, True, centered, random.Random(seed)) for seed in seeds]
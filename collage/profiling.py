@@ -0,0 +1,165 @@
+"""Opt-in instrumentation of the render pipeline: wall time and pixel memory per stage and per image."""
+import contextvars
+import logging
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("decode", "fit", "paste", "preview", "encode")
+
+# One measured step. `bytes` is the pixel (or encoded) memory the step allocated; Pillow allocates image buffers
+# outside the Python allocator, so they are counted from the image sizes rather than traced. `image` labels the
+# source (see sources.source_label), `source_megapixels` is its full resolution and `target_size` the tile size.
+StageRecord = namedtuple("StageRecord", ["stage", "seconds", "bytes", "image", "source_megapixels", "target_size"])
+
+# Callables receiving every StageRecord as it is recorded, e.g. to feed a metrics client
+PROFILE_HOOKS = []
+
+_PROFILE = contextvars.ContextVar("collage_profile", default=None)
+
+
+class RenderProfile:
+    """Thread-safe collection of StageRecords with a summary report."""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+        logger.debug("%s %.2f ms %s", record.stage, record.seconds * 1000, record.image or "")
+        for hook in PROFILE_HOOKS:
+            hook(record)
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def report(self):
+        """
+        Summarize the records.
+
+        Returns:
+            dict: "stages" maps each stage to its count, total and max seconds, total and peak bytes; "images" has
+            one row per source with its megapixels, target sizes and seconds per stage, slowest first;
+            "wall_seconds" is the time since the profile was created and "peak_rss" the process high-water mark
+            in bytes (None where unavailable).
+        """
+        with self._lock:
+            records = list(self.records)
+
+        stages, images = {}, {}
+        for record in records:
+            stage = stages.setdefault(record.stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0,
+                                                     "peak_bytes": 0})
+            stage["count"] += 1
+            stage["seconds"] += record.seconds
+            stage["max_seconds"] = max(stage["max_seconds"], record.seconds)
+            stage["bytes"] += record.bytes
+            stage["peak_bytes"] = max(stage["peak_bytes"], record.bytes)
+            if record.image is None:
+                continue
+            image = images.setdefault(record.image, {"image": record.image, "source_megapixels": None,
+                                                     "target_sizes": [], "seconds": 0.0})
+            if record.source_megapixels is not None:
+                image["source_megapixels"] = record.source_megapixels
+            if record.target_size is not None and record.target_size not in image["target_sizes"]:
+                image["target_sizes"].append(record.target_size)
+            image[record.stage] = image.get(record.stage, 0.0) + record.seconds
+            image["seconds"] += record.seconds
+
+        return {
+            "stages": {name: stages[name] for name in sorted(stages, key=_stage_order)},
+            "images": sorted(images.values(), key=lambda image: image["seconds"], reverse=True),
+            "wall_seconds": time.perf_counter() - self.started,
+            "peak_rss": peak_rss(),
+        }
+
+
+def _stage_order(name):
+    return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_profile():
+    """Return the profile recording in this context, or None."""
+    return _PROFILE.get()
+
+
+@contextmanager
+def profiled(profile=None):
+    """
+    Record every instrumented stage run in this context (and in render worker jobs) into a profile.
+
+    Parameters:
+        profile (RenderProfile): Profile to add to (default: a new one).
+
+    Yields:
+        RenderProfile: The active profile.
+    """
+    profile = profile if profile is not None else RenderProfile()
+    token = _PROFILE.set(profile)
+    try:
+        yield profile
+    finally:
+        _PROFILE.reset(token)
+
+
+def run_profiled(profile, func, *args, **kwargs):
+    """Call func(*args, **kwargs) with `profile` active, e.g. as an executor job."""
+    with profiled(profile):
+        return func(*args, **kwargs)
+
+
+def collect_records(func, job):
+    """Run a render job under a fresh profile and return (result, records), so worker processes can report back."""
+    with profiled() as profile:
+        return func(job), profile.records
+
+
+@contextmanager
+def timed(stage, image=None, source_megapixels=None, target_size=None):
+    """
+    Time a stage if a profile is active; a no-op otherwise.
+
+    Yields:
+        dict: Set "bytes" to report the memory the stage allocated.
+    """
+    profile = _PROFILE.get()
+    if profile is None:
+        yield {}
+        return
+    measured = {"bytes": 0}
+    start = time.perf_counter()
+    try:
+        yield measured
+    finally:
+        profile.add(StageRecord(stage, time.perf_counter() - start, measured["bytes"], image, source_megapixels,
+                                None if target_size is None else tuple(target_size)))
+
+
+def image_bytes(img):
+    """Bytes occupied by a PIL image's pixels; Pillow keeps RGB, LA and other multiband pixels in 4 bytes."""
+    if img.mode in ("1", "L", "P"):
+        return img.width * img.height
+    if img.mode.startswith("I;16"):
+        return img.width * img.height * 2
+    return img.width * img.height * 4
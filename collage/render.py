@@ -0,0 +1,462 @@
+"""Executing placement plans: tile decoding on a worker pool, the fitted tile cache and the collage functions."""
+import functools
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from .constants import DEFAULT_WORKERS, RENDER_BACKENDS, TILE_CACHE_BYTES
+from .layouts import plan_layout, scale_plan
+from .profiling import collect_records, current_profile, image_bytes, timed
+from .sources import _read_bytes, content_hash, fit_tiles, load_for_size, source_label, source_sizes
+
+
+def _load_tile(job):
+    source, size, crop, quality = job
+    return load_for_size(source, size, quality, crop)
+
+
+def _load_source_tiles(job):
+    return fit_tiles(*job)
+
+
+def _picklable_source(source):
+    # Uploaded files can't cross a process boundary, their encoded bytes can
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    return _read_bytes(source)
+
+
+class TileCache:
+    """
+    Thread-safe LRU cache of fitted tiles, bounded by the bytes their pixels occupy.
+
+    Keys come from tile_key(), so the same upload fitted to the same cell is reused across renders
+    regardless of padding, background, order or randomization.
+    """
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached tile for `key`, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            img = self._tiles.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        """Store a tile and evict the least recently used ones until the cache fits its budget."""
+        if key is None:
+            return
+        size = image_bytes(img)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._tiles:
+                return
+            self._tiles[key] = img
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self.bytes -= image_bytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._tiles),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+TILE_CACHE = TileCache()
+
+
+def tile_key(source, size, crop, quality):
+    """Build a TileCache key: (content hash, target size, resample mode, crop box)."""
+    digest = content_hash(source)
+    if digest is None:
+        return None
+    return digest, tuple(size), quality, None if crop is None else tuple(round(value, 6) for value in crop)
+
+
+def load_tiles(tiles, quality="quality", backend="thread", workers=None, cache=TILE_CACHE):
+    """
+    Decode and fit a batch of tiles, in parallel unless the serial backend is selected.
+
+    Parameters:
+        tiles (list): (source, (width, height), crop) triples; crop may be None for a centered fit.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        cache (TileCache): Cache consulted before decoding and filled afterwards; None disables it.
+
+    Returns:
+        list: Fitted PIL images, in the same order as `tiles`.
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError("Backend must be 'thread', 'process' or 'serial'.")
+
+    keys = [None] * len(tiles)
+    results = [None] * len(tiles)
+    if cache is not None:
+        for idx, (source, size, crop) in enumerate(tiles):
+            keys[idx] = tile_key(source, size, crop, quality)
+            results[idx] = cache.get(keys[idx])
+
+    # Only decode the tiles whose geometry changed since they were last cached
+    missing = [idx for idx, img in enumerate(results) if img is None]
+    jobs = [(*tiles[idx], quality) for idx in missing]
+    for idx, img in zip(missing, _run_jobs(_load_tile, jobs, backend, workers)):
+        results[idx] = img
+        if cache is not None:
+            cache.put(keys[idx], img)
+    return results
+
+
+def _run_jobs(func, jobs, backend, workers):
+    profile = current_profile()
+    if profile is not None:
+        # Jobs record into their own profile and hand the records back, which also works across processes
+        results = []
+        for result, records in _map_jobs(functools.partial(collect_records, func), jobs, backend, workers):
+            profile.extend(records)
+            results.append(result)
+        return results
+    return _map_jobs(func, jobs, backend, workers)
+
+
+def _map_jobs(func, jobs, backend, workers):
+    # Every job is a tuple whose first item is the image source
+    workers = workers or DEFAULT_WORKERS
+    if backend == "serial" or workers == 1 or len(jobs) < 2:
+        return [func(job) for job in jobs]
+
+    if backend == "thread":
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, jobs))
+
+    jobs = [(_picklable_source(job[0]), *job[1:]) for job in jobs]
+    # Imported here: multiprocessing is only worth its import time when the process backend is used
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, jobs))
+
+
+def new_canvas(size, background="#ffffff", quality="quality", cache=TILE_CACHE):
+    """
+    Create a blank canvas filled with a color, or with a background image fitted to the canvas size.
+
+    Parameters:
+        size (tuple): Canvas (width, height).
+        background (str | image source): Background color, or an image fitted to the canvas.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        cache (TileCache): Cache of fitted backgrounds, keyed like tiles; None disables it.
+
+    Returns:
+        PIL.Image: RGB canvas the caller can draw on.
+
+    Notes:
+        - A background image is decoded and fitted once per content hash and size; every render gets a copy.
+    """
+    if isinstance(background, str):
+        return Image.new("RGB", size, background)
+
+    key = tile_key(background, size, None, quality) if cache is not None else None
+    fitted = cache.get(key) if key is not None else None
+    if fitted is None:
+        fitted = load_for_size(background, size, quality).convert("RGB")
+        if key is not None:
+            cache.put(key, fitted)
+    return fitted.copy()
+
+
+def render_plan(plan, images, collage, quality="quality", backend="thread", workers=None, cache=TILE_CACHE):
+    """
+    Execute a placement plan: load all tiles at once, then paste them onto the canvas in order.
+
+    Parameters:
+        plan (list): Placement tuples produced by one of the plan_* functions.
+        images (list): Sources the placement indexes point into.
+        collage (PIL.Image): Canvas to paste onto.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        cache (TileCache): Fitted tile cache; None disables it.
+    """
+    tiles = [(images[placement.index], (placement.width, placement.height), placement.crop) for placement in plan]
+    for img, placement in zip(load_tiles(tiles, quality, backend, workers, cache), plan):
+        with timed("paste", source_label(images[placement.index]), target_size=img.size):
+            collage.paste(img, (placement.x, placement.y))
+    return collage
+
+
+def render_plans(plans, images, canvases, quality="quality", backend="thread", workers=None, cache=TILE_CACHE):
+    """
+    Execute several plans over the same sources, decoding each source at most once.
+
+    Parameters:
+        plans (list): Placement plans, e.g. one per target size.
+        images (list): Sources the placement indexes point into.
+        canvases (list): One canvas per plan.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        cache (TileCache): Fitted tile cache; None disables it.
+
+    Returns:
+        list: The canvases, with every plan pasted.
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError("Backend must be 'thread', 'process' or 'serial'.")
+
+    placements = [(canvas, placement) for plan, canvas in zip(plans, canvases) for placement in plan]
+    keys = [None] * len(placements)
+    results = [None] * len(placements)
+    if cache is not None:
+        for idx, (_, placement) in enumerate(placements):
+            source = images[placement.index]
+            keys[idx] = tile_key(source, (placement.width, placement.height), placement.crop, quality)
+            results[idx] = cache.get(keys[idx])
+
+    # Group the missing tiles by source: one job decodes a source once and fits all of its tiles. Plans that put a
+    # source into the same cell geometry share one fitted tile
+    missing = {}
+    for idx, (_, placement) in enumerate(placements):
+        if results[idx] is None:
+            target = ((placement.width, placement.height), placement.crop)
+            missing.setdefault(placement.index, {}).setdefault(target, []).append(idx)
+    jobs = [(images[index], list(targets), quality) for index, targets in missing.items()]
+    for targets, tiles in zip(missing.values(), _run_jobs(_load_source_tiles, jobs, backend, workers)):
+        for indexes, img in zip(targets.values(), tiles):
+            for idx in indexes:
+                results[idx] = img
+            if cache is not None:
+                cache.put(keys[indexes[0]], img)
+
+    for img, (canvas, placement) in zip(results, placements):
+        with timed("paste", source_label(images[placement.index]), target_size=img.size):
+            canvas.paste(img, (placement.x, placement.y))
+    return canvases
+
+
+def fanout_collages(images, layout, sizes, padding, randomization=False, centered=False, background="#ffffff",
+                    quality="quality", backend="thread", workers=None, cache=TILE_CACHE, seed=None):
+    """
+    Render one image set to several canvas sizes in a single pass.
+
+    Parameters:
+        images (list): Image sources.
+        layout (str): One of LAYOUTS.
+        sizes (dict): Target name -> (width, height), e.g. a selection of SOCIAL_MEDIA_IMAGE_SIZES.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order, identically for every size.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        background (str | image source): Background color, or an image fitted to each canvas.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        cache (TileCache): Fitted tile cache; None disables it.
+        seed (int): Seed of the randomized arrangement (default: drawn from the global `random` state).
+
+    Returns:
+        dict: Target name -> collage.
+
+    Notes:
+        - Each source is decoded once, at the resolution its largest tile needs; only resampling is per size.
+    """
+    dimensions = source_sizes(images)
+    # One seed gives every size the same order and split directions, without touching the global state other
+    # threads draw from
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    plans, canvases = [], []
+    for size in sizes.values():
+        rng = random.Random(seed)
+        plans.append(plan_layout(layout, dimensions, size, padding, randomization, centered, rng))
+        canvases.append(new_canvas(size, background, quality, cache))
+
+    render_plans(plans, images, canvases, quality, backend, workers, cache)
+    return dict(zip(sizes, canvases))
+
+
+def render_preview(plan, proxies, canvas, scale):
+    """
+    Composite a low-resolution preview of a plan from proxies.
+
+    Parameters:
+        plan (list): Full-resolution Placement tuples.
+        proxies (list): Proxy images (see make_proxy), indexed like the plan's sources.
+        canvas (PIL.Image): Blank canvas already scaled by `scale`.
+        scale (float): Preview scale relative to the full-resolution canvas.
+    """
+    with timed("preview", target_size=canvas.size):
+        return render_plan(scale_plan(plan, scale), proxies, canvas, quality="fast", backend="serial", cache=None)
+
+
+def render_variants(plans, images, canvas, scale=1.0, quality="fast", backend="serial", workers=None, cache=None):
+    """
+    Render several plans of the same image set, e.g. from plan_variants(), onto copies of one canvas.
+
+    Parameters:
+        plans (list): Placement plans for the full-resolution canvas.
+        images (list): Sources the placement indexes point into, e.g. proxies for thumbnails.
+        canvas (PIL.Image): Blank canvas already scaled by `scale`; it is copied, not drawn on.
+        scale (float): Canvas scale relative to the plans.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Pool size (default: DEFAULT_WORKERS).
+        cache (TileCache): Fitted tile cache; None disables it.
+
+    Returns:
+        list: One collage per plan.
+
+    Notes:
+        - Every source is decoded once for all variants, and cells with the same geometry share one fitted tile.
+    """
+    plans = [scale_plan(plan, scale) for plan in plans]
+    return render_plans(plans, images, [canvas.copy() for _ in plans], quality, backend, workers, cache)
+
+
+def contact_sheet(collages, labels=None, columns=4, gap=8, background="#ffffff"):
+    """
+    Lay out thumbnails on one sheet, each with an optional caption underneath.
+
+    Parameters:
+        collages (list): Equally sized PIL images.
+        labels (list): One caption per image, e.g. its seed.
+        columns (int): Thumbnails per row.
+        gap (int): Space between thumbnails and sheet edges.
+        background (str): Sheet color.
+
+    Returns:
+        PIL.Image: Contact sheet.
+    """
+    columns = max(1, min(columns, len(collages)))
+    rows = -(-len(collages) // columns)
+    width, height = collages[0].size
+    caption = 16 if labels else 0
+    sheet = Image.new("RGB", (columns * (width + gap) + gap, rows * (height + caption + gap) + gap), background)
+    draw = ImageDraw.Draw(sheet)
+    for idx, collage in enumerate(collages):
+        x = gap + (idx % columns) * (width + gap)
+        y = gap + (idx // columns) * (height + caption + gap)
+        sheet.paste(collage, (x, y))
+        if labels:
+            draw.text((x, y + height + 2), str(labels[idx]), fill="#000000")
+    return sheet
+
+
+def golden_ratio_collage(images, collage, padding, randomization, quality="quality", backend="thread",
+                         workers=None, rng=None):
+    """
+    Create a golden ratio-based collage from the provided images.
+
+    Parameters:
+        images (list): List of image file paths to include in the collage.
+        collage (PIL.Image): Blank canvas to place the images.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Number of decode workers (default: DEFAULT_WORKERS).
+        rng (random.Random): Source of randomness (default: the global `random` state); `images` is never reordered.
+
+    Notes:
+        - Images are dynamically resized based on the golden ratio and remaining working area.
+    """
+    plan = plan_layout("golden_ratio", source_sizes(images), collage.size, padding, randomization, rng=rng)
+    return render_plan(plan, images, collage, quality, backend, workers)
+
+
+def grid_collage(images, collage, padding, randomization, centered, quality="quality", backend="thread",
+                 workers=None, rng=None):
+    """
+    Create a grid-based collage.
+
+    Parameters:
+        images (list): List of image file paths to include in the collage.
+        collage (PIL.Image): Blank canvas to place the images.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Number of decode workers (default: DEFAULT_WORKERS).
+        rng (random.Random): Source of randomness (default: the global `random` state); `images` is never reordered.
+    """
+    plan = plan_layout("grid", source_sizes(images), collage.size, padding, randomization, centered, rng)
+    return render_plan(plan, images, collage, quality, backend, workers)
+
+
+def lane_collage(images, collage, padding, randomization, centered, orientation="horizontal", quality="quality",
+                 backend="thread", workers=None, rng=None):
+    """
+    Create a lane-based collage.
+
+    Parameters:
+        images (list): List of image file paths to include in the collage.
+        collage (PIL.Image): Blank canvas to place the images.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Whether to center the grid if the canvas is not square.
+        orientation (str): Orientation of the grid: "horizontal" or "vertical".
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Number of decode workers (default: DEFAULT_WORKERS).
+        rng (random.Random): Source of randomness (default: the global `random` state); `images` is never reordered.
+    """
+    if orientation not in ("horizontal", "vertical"):
+        raise ValueError("Orientation must be 'horizontal' or 'vertical'.")
+
+    # Horizontal lanes are stacked on top of each other, vertical ones form a strip
+    plan = plan_layout("stack" if orientation == "horizontal" else "strip", source_sizes(images), collage.size,
+                       padding, randomization, centered, rng)
+    return render_plan(plan, images, collage, quality, backend, workers)
+
+
+def auto_layout(images, collage, padding, randomization, centered, quality="quality", backend="thread",
+                workers=None, rng=None):
+    """
+    Create an auto layout.
+
+    Args:
+        images (list): List of image file paths to include in the collage.
+        collage (PIL.Image): Blank canvas to place the images.
+        padding (int): Space between images and canvas edges.
+        randomization (bool): Randomize image placement and order.
+        centered (bool): Whether to center the grid if the canvas is not square (default: False).
+        quality (str): Resampling trade-off, "quality" or "fast".
+        backend (str): Execution backend, one of RENDER_BACKENDS.
+        workers (int): Number of decode workers (default: DEFAULT_WORKERS).
+        rng (random.Random): Source of randomness (default: the global `random` state); `images` is never reordered.
+    """
+    plan = plan_layout("auto", source_sizes(images), collage.size, padding, randomization, centered, rng)
+    return render_plan(plan, images, collage, quality, backend, workers)
@@ -0,0 +1,130 @@
+"""Layout search: score many geometry-only candidate plans with NumPy and keep the best one."""
+import math
+
+import numpy as np
+
+from .constants import SEARCH_SAMPLES, SEARCH_WEIGHTS
+from .layouts import Placement, fit_crop, plan_golden_ratio, plan_grid, plan_justified, plan_lane
+
+DIRECTIONS = [(horizontal, vertical) for horizontal in ("right-to-left", "left-to-right")
+              for vertical in ("bottom-to-top", "top-to-bottom")]
+
+
+def _grid_cells(images_num, cols, canvas_size, padding):
+    """Cells of a `cols`-wide grid, row by row, as (x, y, width, height) tuples."""
+    canvas_width, canvas_height = canvas_size
+    rows = math.ceil(images_num / cols)
+    cell_width = (canvas_width - (cols + 1) * padding) // cols
+    cell_height = (canvas_height - (rows + 1) * padding) // rows
+    return [((idx % cols) * (cell_width + padding) + padding, (idx // cols) * (cell_height + padding) + padding,
+             cell_width, cell_height) for idx in range(images_num)]
+
+
+def _templates(sizes, canvas_size, padding, centered):
+    """
+    Collect candidate cell geometries that don't depend on which image goes where.
+
+    Returns:
+        list: Lists of (x, y, width, height) cells, one image per cell.
+    """
+    images_num = len(sizes)
+    plans = [plan_grid(sizes, canvas_size, padding, centered),
+             plan_lane(sizes, canvas_size, padding, centered, orientation="horizontal"),
+             plan_lane(sizes, canvas_size, padding, centered, orientation="vertical")]
+    plans += [plan_golden_ratio(sizes, canvas_size, padding, horizontal, vertical)
+              for horizontal, vertical in DIRECTIONS]
+
+    templates = [[(placement.x, placement.y, placement.width, placement.height) for placement in plan]
+                 for plan in plans]
+    # Every grid shape, not only the one plan_grid settles on
+    templates += [_grid_cells(images_num, cols, canvas_size, padding) for cols in range(1, images_num + 1)]
+    # Layouts that stop early or run out of room can't hold the whole set
+    return [cells for cells in templates
+            if len(cells) == images_num and all(width > 0 and height > 0 for _, _, width, height in cells)]
+
+
+def score_cells(cells, orders, sizes, canvas_size, weights=SEARCH_WEIGHTS):
+    """
+    Score every assignment of images to one set of cells at once.
+
+    Parameters:
+        cells (list): (x, y, width, height) cells.
+        orders (numpy.ndarray): (candidates, cells) array; row i puts image orders[i, k] into cell k.
+        sizes (list): Source (width, height) pairs.
+        canvas_size (tuple): Canvas (width, height).
+        weights (dict): Weights of the "crop", "upscale" and "unused" terms.
+
+    Returns:
+        numpy.ndarray: One score per candidate, lower is better.
+
+    Notes:
+        - crop: mean fraction of each source cut away to fill its cell.
+        - upscale: mean log of how far a source is enlarged beyond its own resolution.
+        - unused: fraction of the canvas not covered by any cell.
+    """
+    cells = np.asarray(cells, dtype=np.float64)
+    sources = np.asarray(sizes, dtype=np.float64)[orders]
+    cell_width, cell_height = cells[:, 2], cells[:, 3]
+    source_width, source_height = sources[..., 0], sources[..., 1]
+
+    # Fitting keeps min(a, b) / max(a, b) of the source when aspect ratios a and b differ
+    ratio = (source_width / source_height) / (cell_width / cell_height)
+    crop = 1 - np.minimum(ratio, 1 / ratio)
+    upscale = np.log(np.maximum(1.0, np.maximum(cell_width / source_width, cell_height / source_height)))
+    unused = 1 - (cell_width * cell_height).sum() / (canvas_size[0] * canvas_size[1])
+    return weights["crop"] * crop.mean(axis=1) + weights["upscale"] * upscale.mean(axis=1) + weights["unused"] * unused
+
+
+def score_plan(plan, sizes, canvas_size, weights=SEARCH_WEIGHTS):
+    """Score a single plan the same way search_layout() does; lower is better."""
+    cells = [(placement.x, placement.y, placement.width, placement.height) for placement in plan]
+    orders = np.array([[placement.index for placement in plan]])
+    return float(score_cells(cells, orders, sizes, canvas_size, weights)[0])
+
+
+def search_layout(sizes, canvas_size, padding, centered=False, samples=SEARCH_SAMPLES, seed=0,
+                  weights=SEARCH_WEIGHTS):
+    """
+    Plan the best-scoring collage among grid shapes, lanes, golden ratio directions and justified rows.
+
+    Parameters:
+        sizes (list): Source (width, height) pairs, in placement order.
+        canvas_size (tuple): Canvas (width, height).
+        padding (int): Space between images and canvas edges.
+        centered (bool): Whether to center grids and justified rows.
+        samples (int): Image orders tried per candidate geometry, including the given order.
+        seed (int): Seed of the sampled orders.
+        weights (dict): Weights of the "crop", "upscale" and "unused" terms, see score_cells().
+
+    Returns:
+        list: Placement tuples of the winning plan.
+
+    Notes:
+        - Only geometry is evaluated; nothing is decoded until the winner is rendered.
+        - Ties keep the given order and the earlier candidate.
+    """
+    images_num = len(sizes)
+    rng = np.random.default_rng(seed)
+    orders = np.tile(np.arange(images_num), (max(1, samples), 1))
+    orders[1:] = rng.permuted(orders[1:], axis=1)
+
+    best_score, best = math.inf, []
+    for cells in _templates(sizes, canvas_size, padding, centered):
+        scores = score_cells(cells, orders, sizes, canvas_size, weights)
+        winner = int(np.argmin(scores))
+        if scores[winner] < best_score:
+            best_score = scores[winner]
+            best = [Placement(int(idx), x, y, width, height, fit_crop(sizes[idx], (width, height)))
+                    for idx, (x, y, width, height) in zip(orders[winner], cells)]
+
+    # Justified geometry depends on the order, so a few orders are planned outright
+    for order in orders[:max(1, samples // 32)]:
+        plan = plan_justified([sizes[idx] for idx in order], canvas_size, padding, centered)
+        if len(plan) != images_num:
+            continue
+        plan = [placement._replace(index=int(order[placement.index])) for placement in plan]
+        score = score_plan(plan, sizes, canvas_size, weights)
+        if score < best_score:
+            best_score, best = score, plan
+
+    return best
@@ -0,0 +1,430 @@
+"""
+Local HTTP render service. Standard library only, meant to run on one box next to the services calling it.
+
+    python -m collage.service --port 8080 --workers 4
+
+    POST /render              multipart form: "images" (4-20 files), layout, platform, padding, centered, seed,
+                              background, format, export_quality, timeout. Answers 202 with the job, or with the
+                              collage itself when called as /render?wait=1. 503 + Retry-After when the queue is full.
+    GET  /jobs/<id>           Job status as JSON.
+    GET  /jobs/<id>/result    The encoded collage once the job is done.
+    GET  /status              Queue depth, worker count and job counters.
+"""
+import argparse
+import io
+import json
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageColor
+
+from .constants import (DECODE_CACHE_BYTES, DECODE_CACHE_DIR, DEFAULT_WORKERS, LAYOUTS, MAX_IMAGES, MAX_PADDING,
+                        MIN_IMAGES, MIN_PADDING, RENDER_QUALITIES, SOCIAL_MEDIA_IMAGE_SIZES)
+from .decode_cache import configure_decode_cache
+from .export import DEFAULT_EXPORT_QUALITY, EXPORT_FORMATS, encode_collage
+from .render import fanout_collages
+
+QUEUE_SIZE = 64
+JOB_TIMEOUT = 60.0
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+MAX_RESULTS = 256
+
+
+def render_request(request):
+    """
+    Render one service request. Runs in a worker process.
+
+    Parameters:
+        request (dict): Encoded images and validated render settings, see parse_request().
+
+    Returns:
+        bytes: Encoded collage.
+    """
+    size = SOCIAL_MEDIA_IMAGE_SIZES[request["platform"]]
+    collages = fanout_collages(request["images"], request["layout"], {request["platform"]: size}, request["padding"],
+                               request["seed"] is not None, request["centered"], request["background"],
+                               request["quality"], backend="serial", seed=request["seed"])
+    return encode_collage(collages[request["platform"]], request["format"], request["export_quality"])
+
+
+def parse_multipart(content_type, body):
+    """
+    Split a multipart/form-data body into fields and files.
+
+    Returns:
+        tuple: ({name: value} for text fields, {name: [bytes, ...]} for file fields).
+    """
+    message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n"
+                                                  + body)
+    if not message.is_multipart():
+        raise ValueError("Expected a multipart/form-data body.")
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name is None:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files.setdefault(name, []).append(payload)
+        else:
+            fields[name] = payload.decode("utf-8")
+    return fields, files
+
+
+def parse_request(fields, files, default_timeout=JOB_TIMEOUT):
+    """
+    Validate a render request the way the CLI validates its arguments.
+
+    Returns:
+        dict: Render settings for render_request(), plus "timeout" in seconds.
+
+    Raises:
+        ValueError: With a message for the client.
+    """
+    images = files.get("images", [])
+    if not MIN_IMAGES <= len(images) <= MAX_IMAGES:
+        raise ValueError(f"Send {MIN_IMAGES}-{MAX_IMAGES} files in the 'images' field, got {len(images)}.")
+    for number, data in enumerate(images, 1):
+        # Only the header is read, like source_sizes() does, so a bad upload never takes a queue slot
+        try:
+            with Image.open(io.BytesIO(data)):
+                pass
+        except (OSError, Image.DecompressionBombError):
+            raise ValueError(f"Image {number} is not a supported image file.") from None
+    layout = fields.get("layout", "auto")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Layout must be one of {', '.join(LAYOUTS)}.")
+    platform = fields.get("platform", "Instagram Feed Square")
+    if platform not in SOCIAL_MEDIA_IMAGE_SIZES:
+        raise ValueError(f"Platform must be one of {', '.join(SOCIAL_MEDIA_IMAGE_SIZES)}.")
+    export_format = fields.get("format", "JPEG").upper()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(EXPORT_FORMATS)}.")
+    quality = fields.get("quality", RENDER_QUALITIES[0])
+    if quality not in RENDER_QUALITIES:
+        raise ValueError("Quality must be 'quality' or 'fast'.")
+    try:
+        padding = int(fields.get("padding", MIN_PADDING))
+        seed = int(fields["seed"]) if fields.get("seed", "") != "" else None
+        export_quality = int(fields.get("export_quality", DEFAULT_EXPORT_QUALITY))
+        timeout = float(fields.get("timeout", default_timeout))
+    except ValueError:
+        raise ValueError("padding, seed and export_quality must be integers, timeout a number.") from None
+    if not MIN_PADDING <= padding <= MAX_PADDING:
+        raise ValueError(f"Padding must be between {MIN_PADDING} and {MAX_PADDING}.")
+    if not 1 <= export_quality <= 100:
+        raise ValueError("export_quality must be between 1 and 100.")
+    if not timeout > 0:
+        raise ValueError("Timeout must be a positive number of seconds.")
+    background = fields.get("background", "#ffffff")
+    try:
+        ImageColor.getrgb(background)
+    except ValueError:
+        raise ValueError(f"Background must be a color, got {background!r}.") from None
+
+    return {
+        "images": images,
+        "layout": layout,
+        "platform": platform,
+        "padding": padding,
+        "centered": fields.get("centered", "").lower() in ("1", "true", "yes", "on"),
+        "seed": seed,
+        "background": background,
+        "quality": quality,
+        "format": export_format,
+        "export_quality": export_quality,
+        "timeout": min(timeout, default_timeout),
+    }
+
+
+class RenderJob:
+    """One queued render and its outcome. `status` is "queued", "running", "done", "failed" or "timeout"."""
+
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.deadline = time.monotonic() + request["timeout"]
+        self.done = threading.Event()
+
+    def finish(self, status, result=None, error=None):
+        self.status, self.result, self.error = status, result, error
+        self.finished = time.time()
+        # The encoded images aren't needed any more; only the result is kept around
+        self.request = {key: value for key, value in self.request.items() if key != "images"}
+        self.done.set()
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "format": self.request["format"],
+            "bytes": None if self.result is None else len(self.result),
+        }
+
+
+class RenderService:
+    """
+    Bounded job queue in front of a worker pool.
+
+    One dispatcher thread per worker takes jobs off the queue, so a job's timeout covers its wait in the queue and
+    its render, and the pool never holds more work than it can start.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=QUEUE_SIZE, timeout=JOB_TIMEOUT, backend="process",
+                 max_results=MAX_RESULTS):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_results = max_results
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self.counters = {"accepted": 0, "rejected": 0, "done": 0, "failed": 0, "timeout": 0}
+        self.render_seconds = 0.0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        executor = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+        self.executor = executor(max_workers=workers)
+        self._dispatchers = [threading.Thread(target=self._dispatch, daemon=True) for _ in range(workers)]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+
+    def submit(self, request):
+        """
+        Queue a request from parse_request().
+
+        Returns:
+            RenderJob: The queued job.
+
+        Raises:
+            queue.Full: When the queue is at capacity; the caller should retry later.
+        """
+        job = RenderJob(request)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise
+        with self._lock:
+            self.counters["accepted"] += 1
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        # Keep every pending job, and only the most recent finished ones
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.max_results)]:
+            del self.jobs[job_id]
+
+    def _dispatch(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            remaining = job.deadline - time.monotonic()
+            if remaining <= 0:
+                self._finish(job, "timeout", error="Timed out waiting in the queue.")
+                continue
+            # This dispatcher's previous render has finished, so a worker is free and the job starts right away
+            future = self.executor.submit(render_request, job.request)
+            job.status, job.started = "running", time.time()
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                self._finish(job, "timeout", error="Timed out while rendering.")
+                # A started render can't be interrupted. Its worker stays busy until it returns, so this
+                # dispatcher doesn't take another job before then
+                wait([future])
+            except Exception as error:
+                self._finish(job, "failed", error=str(error) or type(error).__name__)
+            else:
+                self._finish(job, "done", result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        job.finish(status, result, error)
+        with self._lock:
+            self.counters[status] += 1
+            if job.started is not None and status == "done":
+                self.render_seconds += job.finished - job.started
+
+    def status(self):
+        """Return queue depth, worker count and job counters."""
+        with self._lock:
+            states = [job.status for job in self.jobs.values()]
+            done = self.counters["done"]
+            return {
+                "workers": self.workers,
+                "queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "running": states.count("running"),
+                "uptime": time.time() - self.started,
+                "job_timeout": self.timeout,
+                "average_render_seconds": self.render_seconds / done if done else None,
+                **self.counters,
+            }
+
+    def close(self):
+        for _ in self._dispatchers:
+            self.queue.put(None)
+        for dispatcher in self._dispatchers:
+            dispatcher.join()
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a RenderService, found on `self.server.service`."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        service = self.server.service
+        if path == "/status":
+            return self._send_json(HTTPStatus.OK, service.status())
+
+        parts = path.split("/")
+        if len(parts) in (3, 4) and parts[1] == "jobs":
+            job = service.get(parts[2])
+            if job is None:
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": "Unknown job."})
+            if len(parts) == 3:
+                return self._send_json(HTTPStatus.OK, job.describe())
+            if parts[3] == "result":
+                return self._send_result(job)
+        self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found."})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/render":
+            return self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found."})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Content-Length must be a byte count."})
+        if length > self.server.max_upload_bytes:
+            self.close_connection = True
+            return self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Upload too large."})
+        body = self.rfile.read(length)
+        try:
+            fields, files = parse_multipart(self.headers.get("Content-Type", ""), body)
+            request = parse_request(fields, files, self.server.service.timeout)
+        except ValueError as error:
+            return self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+
+        try:
+            job = self.server.service.submit(request)
+        except queue.Full:
+            return self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Render queue is full, retry later."},
+                                   {"Retry-After": "1"})
+
+        if parse_qs(url.query).get("wait", ["0"])[0] not in ("", "0", "false"):
+            job.done.wait(request["timeout"] + 1)
+            return self._send_result(job)
+        self._send_json(HTTPStatus.ACCEPTED, job.describe(), {"Location": f"/jobs/{job.id}"})
+
+    def _send_result(self, job):
+        if job.status == "done":
+            return self._send(HTTPStatus.OK, job.result, EXPORT_FORMATS[job.request["format"]][1])
+        if job.status in ("queued", "running"):
+            return self._send_json(HTTPStatus.CONFLICT, job.describe(), {"Retry-After": "1"})
+        status = HTTPStatus.GATEWAY_TIMEOUT if job.status == "timeout" else HTTPStatus.INTERNAL_SERVER_ERROR
+        self._send_json(status, job.describe())
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8080, service=None, max_upload_bytes=MAX_UPLOAD_BYTES, quiet=False):
+    """
+    Create the HTTP server for a RenderService (default: one with the default settings).
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever() on it, and service.close() once it has shut down.
+    """
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = service or RenderService()
+    server.max_upload_bytes = max_upload_bytes
+    server.quiet = quiet
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m collage.service", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="Render worker processes")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Jobs waiting before requests get a 503")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT, help="Longest a job may wait and render, seconds")
+    parser.add_argument("--max-upload-mb", type=float, default=MAX_UPLOAD_BYTES / 2 ** 20)
+    parser.add_argument("--backend", choices=("process", "thread"), default="process", help="Worker pool type")
+    parser.add_argument("--decode-cache", default=DECODE_CACHE_DIR, help="Directory of the shared decode cache")
+    parser.add_argument("--decode-cache-mb", type=float, default=DECODE_CACHE_BYTES / 2 ** 20,
+                        help="Disk budget of the decode cache, 0 disables it")
+    parser.add_argument("--quiet", action="store_true", help="Don't log requests")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Before the pool starts, so every worker process maps the same cache
+    configure_decode_cache(args.decode_cache if args.decode_cache_mb > 0 else None,
+                           int(args.decode_cache_mb * 2 ** 20))
+    service = RenderService(args.workers, args.queue_size, args.timeout, args.backend)
+    server = make_server(args.host, args.port, service, int(args.max_upload_mb * 2 ** 20), args.quiet)
+    print(f"Serving on http://{args.host}:{server.server_port} with {args.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
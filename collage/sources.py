@@ -0,0 +1,321 @@
+"""Reading, hashing, ingesting and decoding image sources."""
+import hashlib
+import io
+import math
+import os
+from collections import namedtuple
+
+from PIL import ExifTags, Image, ImageOps
+
+from . import decode_cache
+from .constants import MAX_SOURCE_SIDE, NORMALIZED_QUALITY, PROXY_SIZE, RENDER_QUALITIES
+from .layouts import aspect_class, fit_crop
+from .profiling import image_bytes, timed
+
+
+# An upload decoded once at ingest: content digest, encoded bytes, header metadata and a screen-sized proxy.
+# `aspect` is "square", "horizontal" or "vertical"; `orientation` is the EXIF orientation tag (1 when absent).
+IngestedImage = namedtuple("IngestedImage", ["digest", "data", "size", "orientation", "aspect", "proxy"])
+
+
+def _read_bytes(source):
+    if isinstance(source, IngestedImage):
+        return source.data
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            return file.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _open_image(source):
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, IngestedImage):
+        source = source.data
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def source_label(source):
+    """Short name of a source for profiling records: a digest prefix or file name, None for anonymous sources."""
+    if isinstance(source, IngestedImage):
+        return source.digest[:12]
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return None
+
+
+def source_sizes(images):
+    """
+    Read image dimensions from headers only, without decoding pixel data.
+
+    Parameters:
+        images (list): Image file paths, encoded image bytes, file-like objects or ingested images.
+
+    Returns:
+        list: (width, height) of each image.
+    """
+    sizes = []
+    for source in images:
+        if isinstance(source, IngestedImage):
+            sizes.append(source.size)
+            continue
+        with _open_image(source) as img:
+            sizes.append(img.size)
+    return sizes
+
+
+def load_for_size(source, size, quality="quality", crop=None):
+    """
+    Open an image and fit it to the target size, avoiding a full-resolution decode where possible.
+
+    Parameters:
+        source (str | bytes | file-like | IngestedImage | PIL.Image): Image file path, encoded image bytes,
+            file-like object, ingested upload or an already decoded image (e.g. a proxy).
+        size (tuple): Target (width, height) of the fitted image.
+        quality (str): "quality" or "fast" (see RENDER_QUALITIES).
+        crop (tuple): Fractional crop box from fit_crop (default: centered fit).
+
+    Returns:
+        PIL.Image: Image of exactly the requested size.
+
+    Notes:
+        - JPEG sources are downscaled by the decoder itself (1/2, 1/4 or 1/8) via Image.draft.
+        - The remaining integer factor is removed with Image.reduce before the final resample.
+    """
+    if quality not in RENDER_QUALITIES:
+        raise ValueError("Quality must be 'quality' or 'fast'.")
+
+    img = _open_image(source)
+    if crop is None:
+        crop = fit_crop(img.size, size)
+    label, megapixels = source_label(source), img.width * img.height / 1e6
+    if not isinstance(source, Image.Image):
+        img = _decode(source, img, _required_scale(img.size, size, crop, quality), label, megapixels, size)
+    return _fit(img, size, crop, quality, label, megapixels)
+
+
+def _decode(source, img, scale, label=None, megapixels=None, size=None):
+    # Let the decoder skip resolution the target doesn't need, then decode. With the shared decode cache enabled, a
+    # source decoded before at this scale or larger is memory-mapped from disk instead
+    cache = decode_cache.DECODE_CACHE
+    digest = content_hash(source) if cache is not None else None
+    needed = (min(img.width, math.ceil(img.width * scale)), min(img.height, math.ceil(img.height * scale)))
+    with timed("decode", label, megapixels, size) as measured:
+        cached = cache.get(digest, needed) if digest is not None else None
+        if cached is not None:
+            return cached
+        if scale < 1:
+            img.draft(None, needed)
+        img.load()
+        measured["bytes"] = image_bytes(img)
+    if digest is not None:
+        cache.put(digest, img)
+    return img
+
+
+def _fit(img, size, crop, quality, label=None, megapixels=None, rows=None):
+    # `rows` (top, bottom) fits only that slice of the tile, e.g. the part of it inside one band of a banded render
+    with timed("fit", label, megapixels, size) as measured:
+        factor = int(1 / _required_scale(img.size, size, crop, quality))
+        if factor < 2 or img.mode in ("1", "P"):
+            factor = 1
+        # The crop box in the coordinates of the reduced image, then narrowed down to the requested rows
+        width, height = -(-img.width // factor), -(-img.height // factor)
+        left, top, right, bottom = crop[0] * width, crop[1] * height, crop[2] * width, crop[3] * height
+        if rows is not None:
+            top, bottom = top + (bottom - top) * rows[0] / size[1], top + (bottom - top) * rows[1] / size[1]
+            size = (size[0], rows[1] - rows[0])
+
+        if factor > 1:
+            # Only reduce the region the resample reads from. Aligned to the factor and with room for the filter
+            # support, so the pixels match those of reducing the whole image
+            margin = math.ceil(3 * max(1, (right - left) / size[0], (bottom - top) / size[1])) + 2
+            region = (max(0, math.floor(left) - margin), max(0, math.floor(top) - margin),
+                      min(width, math.ceil(right) + margin), min(height, math.ceil(bottom) + margin))
+            img = img.reduce(factor, box=(region[0] * factor, region[1] * factor, min(img.width, region[2] * factor),
+                                          min(img.height, region[3] * factor)))
+            left, top, right, bottom = left - region[0], top - region[1], right - region[0], bottom - region[1]
+
+        method = Image.Resampling.LANCZOS if quality == "quality" else Image.Resampling.BILINEAR
+        img = img.resize(tuple(size), method, box=(left, top, right, bottom))
+        if img.mode == "RGBX":
+            # Decoded from the decode cache
+            img = img.convert("RGB")
+        measured["bytes"] = image_bytes(img)
+    return img
+
+
+def _required_scale(image_size, size, crop, quality):
+    # Smallest source scale that still covers the target with the cropped region. "quality" stops at twice the
+    # target size so the final LANCZOS pass still has pixels to filter.
+    left, top, right, bottom = crop
+    headroom = 2 if quality == "quality" else 1
+    return max(size[0] / ((right - left) * image_size[0]), size[1] / ((bottom - top) * image_size[1])) * headroom
+
+
+def _decode_scale(img, targets, quality):
+    return max(_required_scale(img.size, size, crop or fit_crop(img.size, size), quality) for size, crop in targets)
+
+
+def decode_for_tiles(source, targets, quality="quality"):
+    """
+    Decode a source once, at the lowest resolution that still serves every one of its tiles.
+
+    Parameters:
+        source (str | bytes | file-like | IngestedImage | PIL.Image): Image source.
+        targets (list): (size, crop) pairs the decoded image will be fitted to; crop may be None.
+        quality (str): Resampling trade-off, "quality" or "fast".
+
+    Returns:
+        PIL.Image: Loaded image, to be passed to load_for_size() for each target.
+    """
+    img = _open_image(source)
+    return _decode(source, img, _decode_scale(img, targets, quality), source_label(source),
+                   img.width * img.height / 1e6)
+
+
+def decoded_size(source, targets, quality="quality"):
+    """
+    Predict the size decode_for_tiles() decodes a source at, from its header alone.
+
+    Parameters:
+        source (str | bytes | file-like | IngestedImage | PIL.Image): Image source.
+        targets (list): (size, crop) pairs; crop may be None.
+        quality (str): Resampling trade-off, "quality" or "fast".
+
+    Returns:
+        tuple: (width, height) of the decoded image.
+    """
+    img = _open_image(source)
+    if isinstance(source, Image.Image):
+        return img.size
+    with img:
+        scale = _decode_scale(img, targets, quality)
+        if scale < 1:
+            # Only JPEG decoders scale; draft() adjusts the reported size without decoding anything
+            img.draft(None, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        return img.size
+
+
+def fit_tiles(source, targets, quality="quality"):
+    """
+    Decode a source once (see decode_for_tiles) and fit it to each of its tiles.
+
+    Parameters:
+        source (str | bytes | file-like | IngestedImage | PIL.Image): Image source.
+        targets (list): (size, crop) pairs; crop may be None for a centered fit.
+        quality (str): Resampling trade-off, "quality" or "fast".
+
+    Returns:
+        list: Fitted PIL images, one per target.
+    """
+    img = _open_image(source)
+    label, megapixels = source_label(source), img.width * img.height / 1e6
+    if not isinstance(source, Image.Image):
+        img = _decode(source, img, _decode_scale(img, targets, quality), label, megapixels)
+    return [_fit(img, size, crop or fit_crop(img.size, size), quality, label, megapixels) for size, crop in targets]
+
+
+def content_hash(source):
+    """
+    Hash the encoded content of an image source.
+
+    Parameters:
+        source (str | bytes | file-like | IngestedImage | PIL.Image): Image source.
+
+    Returns:
+        str: Hex digest, or None for decoded images, which have no encoded content to hash.
+    """
+    if isinstance(source, Image.Image):
+        return None
+    if isinstance(source, IngestedImage):
+        return source.digest
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        digest.update(_read_bytes(source))
+    return digest.hexdigest()
+
+
+def make_proxy(source, max_side=PROXY_SIZE):
+    """
+    Decode a small RGB stand-in for an image, used to composite previews.
+
+    Parameters:
+        source (str | bytes | file-like): Image file path, encoded image bytes or file-like object.
+        max_side (int): Longest side of the proxy.
+
+    Returns:
+        PIL.Image: Proxy with the source's aspect ratio.
+    """
+    img = _open_image(source)
+    # thumbnail() drafts JPEGs at reduced resolution before resampling
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return img.convert("RGB")
+
+
+def normalize_image(source, max_side=MAX_SOURCE_SIDE):
+    """
+    Shrink an image to at most `max_side` on its shortest side and make it upright.
+
+    Parameters:
+        source (str | bytes | file-like): Image file path, encoded image bytes or file-like object.
+        max_side (int): Shortest side of the normalized image.
+
+    Returns:
+        bytes: The original bytes if they need neither, or are smaller than the result; otherwise an RGB JPEG.
+    """
+    data = _read_bytes(source)
+    img = _open_image(data)
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    scale = max_side / min(img.size)
+    if scale >= 1 and orientation == 1:
+        # Re-encoding would only cost a lossy generation
+        return data
+    if scale < 1:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        # Let JPEGs decode at reduced resolution, so the full-size decode is skipped as well
+        img.draft(None, size)
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=NORMALIZED_QUALITY)
+    # A rotated image has to be re-encoded; an upright one is only worth it if that saves bytes
+    if orientation == 1 and buffer.tell() >= len(data):
+        return data
+    return buffer.getvalue()
+
+
+def ingest(source, digest=None, max_side=None):
+    """
+    Read an upload once and keep everything later stages need from it.
+
+    Parameters:
+        source (str | bytes | file-like): Image file path, encoded image bytes or file-like object.
+        digest (str): Precomputed content_hash of the source, if the caller already has it.
+        max_side (int): Normalize the upload with normalize_image() to this bound (default: keep the original).
+
+    Returns:
+        IngestedImage: Digest, encoded bytes, metadata and proxy of the upload.
+    """
+    data = _read_bytes(source)
+    digest = digest or content_hash(data)
+    if max_side is not None:
+        # Normalized bytes are derived deterministically from the original, so the digest stays content-addressed
+        data = normalize_image(data, max_side)
+        digest = f"{digest}@{max_side}"
+
+    with Image.open(io.BytesIO(data)) as img:
+        size = img.size
+        orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    return IngestedImage(digest, data, size, orientation, aspect_class(size), make_proxy(data))
@@ -1,36 +1,17 @@
-import io
-import math
+import logging
 import random
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 
-import numpy as np
 import streamlit as st
-from PIL import Image, ImageOps
-
-GOLDEN_RATIO = (1 + math.sqrt(5)) / 2  # Define the golden ratio
-
-MIN_IMAGES = 4
-MAX_IMAGES = 20
-
-MIN_PADDING = 0
-MAX_PADDING = 50
-
-# Provided data for social media sizes
-SOCIAL_MEDIA_IMAGE_SIZES = {
-    "Instagram Feed Square": (1080, 1080),
-    "Instagram Feed Portrait": (1080, 1350),
-    "Instagram Feed Landscape": (1080, 608),
-    "Instagram Stories/Reels": (1080, 1920),
-    "Facebook Feed Post": (1200, 630),
-    "Facebook Stories": (1080, 1920),
-    "Facebook Event Cover": (1920, 1005),
-    "YouTube Thumbnail": (1280, 720),
-    "YouTube Channel Art": (2560, 1440),
-    "X Single Image": (1200, 675),
-    "X Multi-Image": (1200, 600),
-    "LinkedIn Feed Post": (1200, 627),
-    "LinkedIn Company Cover": (1128, 191),
-}
+
+from collage import (DECODE_CACHE_DIR, DEFAULT_COMPRESS_LEVEL, DEFAULT_EXPORT_QUALITY, DEFAULT_WORKERS,
+                     EXPORT_FORMATS, MAX_IMAGES, MAX_PADDING, MAX_SOURCE_SIDE, MAX_VARIANTS, MIN_IMAGES, MIN_PADDING,
+                     RENDER_BACKENDS, RENDER_QUALITIES, SOCIAL_MEDIA_IMAGE_SIZES, THUMBNAIL_SIZE, TILE_CACHE,
+                     RenderProfile, configure_decode_cache, contact_sheet, content_hash, encode_collage,
+                     fanout_collages, ingest, new_canvas, plan_layout, plan_variants, preview_scale, profiled,
+                     render_plan, render_preview, render_variants, run_profiled, source_sizes, zip_collages)
 
 # Icons for each platform
 SOCIAL_MEDIA_ICONS = {
@@ -41,256 +22,8 @@ SOCIAL_MEDIA_ICONS = {
     "LinkedIn": "https://upload.wikimedia.org/wikipedia/commons/c/ca/LinkedIn_logo_initials.png",
 }
 
-
-def golden_ratio_collage(images, collage, padding, randomization):
-    """
-    Create a golden ratio-based collage from the provided images.
-
-    Parameters:
-        images (list): List of image file paths to include in the collage.
-        collage (PIL.Image): Blank canvas to place the images.
-        padding (int): Space between images and canvas edges.
-        randomization (bool): Randomize image placement and order.
-
-    Notes:
-        - Images are dynamically resized based on the golden ratio and remaining working area.
-    """
-    # Initialize the working area for placing images
-    working_area = {
-        "x": 0,
-        "y": 0,
-        "width": collage.width,
-        "height": collage.height,
-    }
-
-    # Determine the initial layout orders
-    horizontal_order = "right-to-left"
-    vertical_order = "bottom-to-top"
-
-    # Determine the initial layout orders
-    if randomization:
-        horizontal_order = random.choice(["right-to-left", "left-to-right"])
-        vertical_order = random.choice(["bottom-to-top", "top-to-bottom"])
-        random.shuffle(images)
-
-    x, y = 0, 0  # Starting position
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        # Decide whether to split horizontally or vertically based on working area dimensions
-        if working_area["width"] > working_area["height"]:  # Horizontal split
-            img = ImageOps.fit(img, (int(working_area["width"] / GOLDEN_RATIO), working_area["height"]),
-                               method=Image.Resampling.LANCZOS)
-            # Adjust position and update working area
-            if horizontal_order == "right-to-left":
-                horizontal_order = "left-to-right"
-                working_area["x"] += img.width + padding
-            else:
-                x = x + working_area["width"] - img.width
-                horizontal_order = "right-to-left"
-            working_area["width"] -= img.width + padding
-        else:  # Vertical split
-            img = ImageOps.fit(img, (working_area["width"], int(working_area["height"] / GOLDEN_RATIO)),
-                               method=Image.Resampling.LANCZOS)
-            # Adjust position and update working area
-            if vertical_order == "bottom-to-top":
-                working_area["y"] += img.height + padding
-                vertical_order = "top-to-bottom"
-            else:
-                y = y + working_area["height"] - img.height
-                vertical_order = "bottom-to-top"
-            working_area["height"] -= img.height + padding
-
-        # Paste the image onto the canvas
-        collage.paste(img, (x, y))
-        x, y = working_area["x"], working_area["y"]  # Update position for the next image
-
-        # Stop if the working area becomes too small
-        if working_area["width"] <= 0 or working_area["height"] <= 0:
-            print("Working area exhausted. Stopping collage creation.")
-            break
-
-    return collage
-
-
-def grid_collage(images, collage, padding, randomization, centered):
-    """
-    Create a grid-based collage.
-
-    Parameters:
-        images (list): List of image file paths to include in the collage.
-        collage (PIL.Image): Blank canvas to place the images.
-        padding (int): Space between images and canvas edges.
-        randomization (bool): Randomize image placement and order.
-        centered (bool): Whether to center the grid if the canvas is not square.
-    """
-    images_num = len(images)
-    if randomization:
-        random.shuffle(images)
-    canvas_width, canvas_height = collage.size
-    if canvas_width == canvas_height:
-        # Square canvas: Determine grid dimensions for a square layout
-        grid_size = math.ceil(math.sqrt(images_num))
-        cell_size = (canvas_width - (grid_size + 1) * padding) // grid_size
-
-        for idx, img_path in enumerate(images):
-            img = Image.open(img_path)
-            img = ImageOps.fit(img, (cell_size, cell_size), method=Image.Resampling.LANCZOS)
-
-            # Calculate position in the grid
-            x = (idx % grid_size) * (cell_size + padding) + padding
-            y = (idx // grid_size) * (cell_size + padding) + padding
-
-            collage.paste(img, (x, y))
-
-    else:
-        # Non-square canvas: Determine grid dimensions for the closest layout
-        cols = math.ceil(math.sqrt(images_num))
-        rows = math.ceil(images_num / cols)
-        offset_x, offset_y = 0, 0
-
-        # Adjust grid dimensions and offsets based on canvas proportions
-        if canvas_width > canvas_height:
-            if cols < rows:
-                cols, rows = rows, cols
-            if centered:
-                offset_x = (canvas_width - (rows * (canvas_height // rows))) // 2
-        elif canvas_width < canvas_height:
-            if cols > rows:
-                cols, rows = rows, cols
-            if centered:
-                offset_y = (canvas_height - (cols * (canvas_width // cols))) // 2
-
-        # Calculate cell dimensions
-        cell_width = (canvas_width - (cols + 1) * padding) // cols
-        cell_height = (canvas_height - (rows + 1) * padding) // rows
-
-        # Use the smaller dimension if centering is enabled
-        if centered:
-            cell_width = cell_height = min(cell_width, cell_height)
-
-        for idx, img_path in enumerate(images):
-            img = Image.open(img_path)
-            img = ImageOps.fit(img, (cell_width, cell_height), method=Image.Resampling.LANCZOS)
-
-            # Calculate position in the grid
-            x = (idx % cols) * (cell_width + padding) + padding + offset_x
-            y = (idx // cols) * (cell_height + padding) + padding + offset_y
-
-            collage.paste(img, (x, y))
-
-    return collage
-
-
-def lane_collage(images, collage, padding, randomization, centered, orientation="horizontal"):
-    """
-    Create a lane-based collage.
-
-    Parameters:
-        images (list): List of image file paths to include in the collage.
-        collage (PIL.Image): Blank canvas to place the images.
-        padding (int): Space between images and canvas edges.
-        randomization (bool): Randomize image placement and order.
-        centered (bool): Whether to center the grid if the canvas is not square.
-        orientation (str): Orientation of the grid: "horizontal" or "vertical".
-    """
-    canvas_width, canvas_height = collage.size
-
-    images_num = len(images)
-
-    if randomization:
-        random.shuffle(images)
-
-    # Determine block size based on orientation
-    if orientation == "horizontal":
-        block_height = (canvas_height - (images_num + 1) * padding) // images_num
-        block_width = canvas_width
-    elif orientation == "vertical":
-        block_width = (canvas_width - (images_num + 1) * padding) // images_num
-        block_height = canvas_height
-    else:
-        raise ValueError("Orientation must be 'horizontal' or 'vertical'.")
-
-    # Centering offsets
-    offset_x, offset_y = 0, 0
-    if centered:
-        if orientation == "horizontal" and images_num * (block_height + padding) < canvas_height:
-            offset_y = (canvas_height - (images_num * (block_height + padding))) // 2
-        if orientation == "vertical" and images_num * (block_width + padding) < canvas_width:
-            offset_x = (canvas_width - (images_num * (block_width + padding))) // 2
-
-    # Resize and paste images
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        img = ImageOps.fit(img, (block_width, block_height), method=Image.Resampling.LANCZOS)
-
-        # Calculate position
-        x, y = 0, 0
-        if orientation == "horizontal":
-            y = idx * (block_height + padding) + padding + offset_y
-        elif orientation == "vertical":
-            x = idx * (block_width + padding) + padding + offset_x
-
-        collage.paste(img, (x, y))
-
-    return collage
-
-
-def auto_layout(images, collage, padding, randomization, centered):
-    """
-    Create an auto layout.
-
-    Args:
-        images (list): List of image file paths to include in the collage.
-        collage (PIL.Image): Blank canvas to place the images.
-        padding (int): Space between images and canvas edges.
-        randomization (bool): Randomize image placement and order.
-        centered (bool): Whether to center the grid if the canvas is not square (default: False).
-    """
-    canvas_width, canvas_height = collage.size
-    images_num = len(images)
-    image_objects_list = []
-    squares = 0
-    horizontal_rectangles = 0
-    vertical_rectangles = 0
-    total_area = 0
-    aspect_ratio_sum_width = aspect_ratio_sum_height = 0
-    for idx, img_path in enumerate(images):
-        img = Image.open(img_path)
-        image_objects_list.append({
-            "image": img
-        })
-        total_area += img.width * img.height
-        if img.height == img.width:
-            squares += 1
-            aspect_ratio_sum_width += 1
-            aspect_ratio_sum_height += 1
-
-        elif img.height > img.width:
-            vertical_rectangles += 1
-            aspect_ratio_sum_height += img.height / img.width
-            aspect_ratio_sum_width += 1
-
-        else:
-            horizontal_rectangles += 1
-            aspect_ratio_sum_width += img.width / img.height
-            aspect_ratio_sum_height += 1
-
-    if squares == images_num:
-        return grid_collage(images, collage, padding, randomization, centered)
-
-    elif horizontal_rectangles == images_num:
-        return lane_collage(images, collage, padding, randomization, centered, orientation="horizontal")
-
-    elif vertical_rectangles == images_num:
-        return lane_collage(images, collage, padding, randomization, centered, orientation="vertical")
-
-    else:
-        canvas_area = canvas_width * canvas_height
-        scaling_factor = math.sqrt(canvas_area / total_area)
-        rows = 0
-        cols = 0
-        aspect_sum_diff = abs(aspect_ratio_sum_width - aspect_ratio_sum_height)
-        return golden_ratio_collage(images, collage, padding, randomization)
+# Full-resolution renders and encodes running at once, across all sessions
+RENDER_JOBS = 4
 
 
 if __name__ == "__main__":
@@ -315,13 +48,31 @@ if __name__ == "__main__":
     # Define default session state values
     default_values = {
         "images": None,
+        "ingested": {},
         "platform": None,
         "background": None,
         "layout": None,
         "randomization": False,
+        "seed": None,
+        "collage_seed": None,
+        "variant_count": 8,
+        "variants": None,
         "centering": False,
         "padding": MIN_PADDING,
+        "quality": RENDER_QUALITIES[0],
+        "backend": RENDER_BACKENDS[0],
+        "workers": DEFAULT_WORKERS,
+        "profiling": False,
+        "profile": None,
+        "preview": None,
+        "render_job": None,
         "collage": None,
+        "export_format": next(iter(EXPORT_FORMATS)),
+        "export_quality": DEFAULT_EXPORT_QUALITY,
+        "compress_level": DEFAULT_COMPRESS_LEVEL,
+        "export_job": None,
+        "exports": {},
+        "fanout_zip": None,
     }
 
     # Initialize session state
@@ -352,35 +103,164 @@ if __name__ == "__main__":
         st.session_state.layout = active_layout
 
 
+    @st.cache_resource(max_entries=4 * MAX_IMAGES, show_spinner=False)
+    def ingest_upload(digest, _file):
+        # Keyed by content hash only, so the same photo uploaded again (or by another session) is decoded once
+        return ingest(_file, digest, MAX_SOURCE_SIDE)
+
+
+    def ingest_uploads(files):
+        # Each upload is hashed once per file_id; unchanged uploads cost nothing on reruns
+        known = st.session_state.ingested
+        st.session_state.ingested = {
+            file.file_id: known.get(file.file_id) or ingest_upload(content_hash(file), file) for file in files
+        }
+        return [st.session_state.ingested[file.file_id] for file in files]
+
+
+    @st.cache_resource
+    def get_decode_cache():
+        # One on-disk cache of decoded sources for every session of this server; sources uploaded again (by any
+        # session) are memory-mapped instead of decoded
+        try:
+            return configure_decode_cache(DECODE_CACHE_DIR)
+        except PermissionError as error:
+            # Renders still work without it, decoding every source
+            logging.getLogger(__name__).warning("Decode cache disabled: %s", error)
+            return None
+
+
+    get_decode_cache()
+
+
+    @st.cache_resource
+    def get_render_executor():
+        # Full-resolution renders and encodes of every session run here, so the preview can be shown while they
+        # finish and one session's render doesn't queue up behind another's
+        return ThreadPoolExecutor(max_workers=RENDER_JOBS)
+
+
+    def export_settings():
+        return st.session_state.export_format, st.session_state.export_quality, st.session_state.compress_level
+
+
+    def profile_context():
+        # Records into the current collage's profile when "Record timings" was on as it was created
+        return profiled(st.session_state.profile) if st.session_state.profile is not None else nullcontext()
+
+
+    def submit_render_job(func, *args, **kwargs):
+        if st.session_state.profile is None:
+            return get_render_executor().submit(func, *args, **kwargs)
+        return get_render_executor().submit(run_profiled, st.session_state.profile, func, *args, **kwargs)
+
+
+    def chain_render_job(render_job, func, *args):
+        # Runs func(collage, *args) on the render pool once render_job is done, without a worker waiting for it
+        executor, profile = get_render_executor(), st.session_state.profile
+        chained = Future()
+
+        def copy_outcome(job):
+            if job.exception() is not None:
+                chained.set_exception(job.exception())
+            else:
+                chained.set_result(job.result())
+
+        def start(job):
+            if job.exception() is not None:
+                return chained.set_exception(job.exception())
+            if profile is None:
+                executor.submit(func, job.result(), *args).add_done_callback(copy_outcome)
+            else:
+                executor.submit(run_profiled, profile, func, job.result(), *args).add_done_callback(copy_outcome)
+
+        render_job.add_done_callback(start)
+        return chained
+
+
+    def handle_fanout_button_click():
+        # One decode pass over the uploads serves every selected platform size
+        collages = fanout_collages(
+            st.session_state.images, st.session_state.layout,
+            {platform: SOCIAL_MEDIA_IMAGE_SIZES[platform] for platform in st.session_state.fanout_platforms},
+            st.session_state.padding, st.session_state.randomization, st.session_state.centering,
+            st.session_state.background["value"], quality=st.session_state.quality, backend=st.session_state.backend,
+            workers=st.session_state.workers,
+            seed=st.session_state.collage_seed)
+        st.session_state.fanout_zip = zip_collages(collages, f"{st.session_state.layout}-collage", *export_settings())
+
+
+    def get_canvas_size():
+        return SOCIAL_MEDIA_IMAGE_SIZES[st.session_state.platform]
+
+
+    def make_blank_canvas(size):
+        # Background images are fitted once per size and cached; each canvas is a copy
+        return new_canvas(size, st.session_state.background["value"], "fast")
+
+
+    def handle_variants_button_click():
+        # Thumbnails come from the proxies; sources are decoded once and equal cells share their tiles
+        images = st.session_state.images
+        base = st.session_state.seed if st.session_state.seed is not None else random.randrange(2 ** 31)
+        seeds = [base + offset for offset in range(st.session_state.variant_count)]
+        size = get_canvas_size()
+        plans = plan_variants(st.session_state.layout, source_sizes(images), size, st.session_state.padding, seeds,
+                              st.session_state.centering)
+        scale = preview_scale(size, THUMBNAIL_SIZE)
+        canvas = make_blank_canvas((max(1, round(size[0] * scale)), max(1, round(size[1] * scale))))
+        thumbnails = render_variants(plans, [image.proxy for image in images], canvas, scale)
+        st.session_state.variants = {
+            "seeds": seeds,
+            "sheet": contact_sheet(thumbnails, [f"seed {seed}" for seed in seeds]),
+        }
+
+
+    def use_variant(seed):
+        st.session_state.randomization = True
+        st.session_state.seed = seed
+        handle_create_collage_button_click()
+
+
     def handle_create_collage_button_click():
-        # Initialize the canvas (background image or color)
-        new_collage = None
-        if st.session_state.background["category"] == "image":
-            new_collage = Image.open(st.session_state.background["value"])
-        else:
-            new_collage = Image.new("RGB", SOCIAL_MEDIA_IMAGE_SIZES[st.session_state.platform],
-                                    st.session_state.background["value"])
-
-        match st.session_state.layout:
-            case "golden_ratio":
-                new_collage = golden_ratio_collage(st.session_state.images, new_collage, st.session_state.padding,
-                                                   st.session_state.randomization)
-            case "grid":
-                new_collage = grid_collage(st.session_state.images, new_collage, st.session_state.padding,
-                                           st.session_state.randomization, st.session_state.centering)
-            case "strip":
-                new_collage = lane_collage(st.session_state.images, new_collage, st.session_state.padding,
-                                           st.session_state.randomization, st.session_state.centering,
-                                           orientation="vertical")
-            case "stack":
-                new_collage = lane_collage(st.session_state.images, new_collage, st.session_state.padding,
-                                           st.session_state.randomization, st.session_state.centering,
-                                           orientation="horizontal")
-            case "auto":
-                new_collage = auto_layout(st.session_state.images, new_collage, st.session_state.padding,
-                                          st.session_state.randomization, st.session_state.centering)
-
-        st.session_state.collage = new_collage
+        images = st.session_state.images
+
+        # The seed is kept so the same arrangement can be re-created, and fanned out to other platforms
+        rng = None
+        st.session_state.collage_seed = None
+        if st.session_state.randomization:
+            seed = st.session_state.seed if st.session_state.seed is not None else random.randrange(2 ** 31)
+            st.session_state.collage_seed = seed
+            rng = random.Random(seed)
+
+        # The canvas always has the platform size, whatever the background image's resolution
+        size = get_canvas_size()
+        background = st.session_state.background["value"]
+
+        st.session_state.profile = RenderProfile() if st.session_state.profiling else None
+        with profile_context():
+            plan = plan_layout(st.session_state.layout, source_sizes(images), size, st.session_state.padding,
+                               st.session_state.randomization, st.session_state.centering, rng)
+
+            # Stage 1: composite a screen-sized preview from cached proxies
+            scale = preview_scale(size)
+            preview_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+            st.session_state.preview = render_preview(plan, [image.proxy for image in images],
+                                                      make_blank_canvas(preview_size), scale)
+
+        # Stage 2: the full-resolution render is only needed for the download
+        st.session_state.collage = None
+        st.session_state.render_job = submit_render_job(render_plan, plan, images,
+                                                        new_canvas(size, background, st.session_state.quality),
+                                                        quality=st.session_state.quality,
+                                                        backend=st.session_state.backend,
+                                                        workers=st.session_state.workers)
+
+        # Stage 3: encode with the current export settings as soon as the render is done
+        st.session_state.exports = {}
+        settings = export_settings()
+        st.session_state.export_job = (settings, chain_render_job(st.session_state.render_job, encode_collage,
+                                                                  *settings))
 
 
     st.header("Step 1. Upload images")
@@ -388,19 +268,19 @@ if __name__ == "__main__":
     uploaded_files = st.file_uploader("Choose images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
 
     if uploaded_files:
-        images = [Image.open(file) for file in uploaded_files]
-        st.write(f"Selected {len(images)} images")
+        st.write(f"Selected {len(uploaded_files)} images")
 
-        if len(images) < MIN_IMAGES:
+        if len(uploaded_files) < MIN_IMAGES:
             st.warning(f"Please select at least {MIN_IMAGES} images for a collage")
-        elif len(images) > MAX_IMAGES:
+        elif len(uploaded_files) > MAX_IMAGES:
             st.warning(f"Please select at most {MAX_IMAGES} images for a collage")
         else:
+            images = ingest_uploads(uploaded_files)
             st.success("Images uploaded successfully!")
             show_images_toggle = st.toggle("Show images")
             if show_images_toggle:
-                st.image(images, use_container_width=True)
-            set_active_images(uploaded_files)
+                st.image([image.proxy for image in images], use_container_width=True)
+            set_active_images(images)
 
     if st.session_state.images is not None:
         st.header("Step 2. Customize size")
@@ -472,10 +352,11 @@ if __name__ == "__main__":
                             bg_file = st.file_uploader("Choose image for background", type=["jpg", "jpeg", "png"],
                                                        accept_multiple_files=False)
                             if bg_file:
-                                bg_img = Image.open(bg_file)
-                                st.image(bg_img, caption="Selected image", use_container_width=True)
+                                # Ingested like the photos: normalized once, shown through its proxy
+                                bg_image = ingest_upload(content_hash(bg_file), bg_file)
+                                st.image(bg_image.proxy, caption="Selected image", use_container_width=True)
                                 st.button("Set background image", on_click=set_active_background,
-                                          args=("image", bg_file),
+                                          args=("image", bg_image),
                                           use_container_width=True, icon=":material/image:")
             else:
                 bg_category = st.session_state.background["category"]
@@ -484,7 +365,7 @@ if __name__ == "__main__":
                 if bg_category == "color":
                     st.write(f"Selected color: {bg_value}")
                 else:
-                    st.image(bg_value, caption="Selected image", use_container_width=True)
+                    st.image(bg_value.proxy, caption="Selected image", use_container_width=True)
 
                 st.button("Re-select background", use_container_width=True, on_click=set_active_background,
                           args=(None, None), icon=":material/format_paint:", help="Re-select background")
@@ -493,8 +374,9 @@ if __name__ == "__main__":
                 st.subheader("Choose layout")
 
                 if st.session_state.layout is None:
-                    layout_options = ["grid", "strip", "stack", "golden_ratio", "auto"]
-                    layout_icons = ["grid_on", "table_rows", "view_column", "grid_goldenratio", "auto_awesome"]
+                    layout_options = ["grid", "strip", "stack", "golden_ratio", "justified", "auto", "search"]
+                    layout_icons = ["grid_on", "table_rows", "view_column", "grid_goldenratio", "view_quilt",
+                                    "auto_awesome", "travel_explore"]
 
                     with st.container(border=True):
                         columns = st.columns(len(layout_options))  # Create dynamic columns
@@ -510,7 +392,7 @@ if __name__ == "__main__":
                               args=(None,), icon=":material/grid_off:", help="Re-select layout")
 
                     st.header("Step 5. Final settings")
-                    st.subheader("Set up padding, centering, and randomization")
+                    st.subheader("Set up padding, centering, randomization, and quality")
                     with st.container(border=True):
                         column1, column2 = st.columns([1, 1])
                         with column1:
@@ -518,24 +400,114 @@ if __name__ == "__main__":
                         with column2:
                             st.checkbox("Randomize image order", key='randomization')
                             st.checkbox("Center images (if possible)", key="centering")
+                            st.number_input("Seed", min_value=0, key="seed",
+                                            disabled=not st.session_state.randomization,
+                                            help="Re-creates a randomized arrangement; leave empty for a new one")
+                        st.radio("Render quality", RENDER_QUALITIES, key="quality", horizontal=True,
+                                 help="'fast' decodes photos close to the cell size and skips the LANCZOS pass")
+                        with st.expander("Rendering backend"):
+                            st.selectbox("Backend", RENDER_BACKENDS, key="backend")
+                            st.number_input("Workers", min_value=1, max_value=MAX_IMAGES, key="workers")
+                            st.checkbox("Record timings", key="profiling",
+                                        help="Time every decode, fit, paste, preview and encode step of the next "
+                                             "collage")
+                            cache_stats = TILE_CACHE.stats()
+                            st.caption(f"Tile cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                                       f"{cache_stats['entries']} tiles, {cache_stats['bytes'] / 2 ** 20:.1f} MB")
+                            if get_decode_cache() is not None:
+                                decode_stats = get_decode_cache().stats()
+                                st.caption(f"Decode cache: {decode_stats['hits']} hits, {decode_stats['misses']} "
+                                           f"misses, {decode_stats['entries']} sources, "
+                                           f"{decode_stats['bytes'] / 2 ** 20:.1f} MB")
                         st.button("Create collage", use_container_width=True,
                                   on_click=handle_create_collage_button_click, icon=":material/auto_awesome_mosaic:")
-
-                    if st.session_state.collage is not None:
+                        with st.expander("Variants"):
+                            st.number_input("Number of variants", min_value=2, max_value=MAX_VARIANTS,
+                                            key="variant_count")
+                            st.button("Generate variants", use_container_width=True,
+                                      on_click=handle_variants_button_click, icon=":material/view_module:")
+                            if st.session_state.variants is not None:
+                                st.image(st.session_state.variants["sheet"], use_container_width=True)
+                                seeds = st.session_state.variants["seeds"]
+                                columns = st.columns(4)
+                                for idx, seed in enumerate(seeds):
+                                    with columns[idx % 4]:
+                                        st.button(f"Use seed {seed}", key=f"variant_{seed}",
+                                                  use_container_width=True, on_click=use_variant, args=(seed,))
+
+                    if st.session_state.preview is not None:
                         st.header("Step 6. Collage preview")
-                        st.image(np.array(st.session_state.collage), caption="Collage Preview",
-                                 use_container_width=True)
-                        # Convert the image to binary format
-                        image_bytes = io.BytesIO()
-                        st.session_state.collage.save(image_bytes, format="PNG")  # Save as PNG or change to "JPEG"
-                        image_bytes.seek(0)  # Move cursor to the beginning
+                        caption = "Collage Preview"
+                        if st.session_state.collage_seed is not None:
+                            caption += f" (seed {st.session_state.collage_seed})"
+                        st.image(st.session_state.preview, caption=caption, use_container_width=True)
+                        if st.session_state.collage is None:
+                            with st.spinner("Rendering full-resolution collage..."):
+                                st.session_state.collage = st.session_state.render_job.result()
+
+                        with st.container(border=True):
+                            column1, column2, column3 = st.columns([1, 1, 1])
+                            with column1:
+                                st.selectbox("Export format", list(EXPORT_FORMATS), key="export_format")
+                            with column2:
+                                st.slider("Quality", min_value=1, max_value=100, key="export_quality",
+                                          disabled=st.session_state.export_format == "PNG")
+                            with column3:
+                                st.slider("Compression level", min_value=0, max_value=9, key="compress_level",
+                                          disabled=st.session_state.export_format == "JPEG",
+                                          help="Higher is smaller but slower to encode")
+
+                        # Encode only when the collage or the export settings change
+                        settings = export_settings()
+                        if settings not in st.session_state.exports:
+                            encoded_settings, export_job = st.session_state.export_job
+                            if encoded_settings == settings:
+                                st.session_state.exports[settings] = export_job.result()
+                            else:
+                                with st.spinner("Encoding..."), profile_context():
+                                    st.session_state.exports[settings] = encode_collage(st.session_state.collage,
+                                                                                        *settings)
+                        extension, mime = EXPORT_FORMATS[st.session_state.export_format]
 
                         # Create a download button
                         st.download_button(
                             label="Download Image",
-                            data=image_bytes,
-                            file_name=f"{str(uuid.uuid4())}-{st.session_state.layout}-collage.png",
-                            mime="image/png",
+                            data=st.session_state.exports[settings],
+                            file_name=f"{str(uuid.uuid4())}-{st.session_state.layout}-collage.{extension}",
+                            mime=mime,
                             use_container_width=True,
                             icon=":material/download:"
                         )
+
+                        with st.expander("Export for several platforms"):
+                            st.multiselect("Platforms", list(SOCIAL_MEDIA_IMAGE_SIZES), key="fanout_platforms")
+                            st.button("Render selected platforms", use_container_width=True,
+                                      disabled=not st.session_state.fanout_platforms,
+                                      on_click=handle_fanout_button_click, icon=":material/dynamic_feed:")
+                            if st.session_state.fanout_zip is not None:
+                                st.download_button(
+                                    label="Download all (zip)",
+                                    data=st.session_state.fanout_zip,
+                                    file_name=f"{str(uuid.uuid4())}-{st.session_state.layout}-collages.zip",
+                                    mime="application/zip",
+                                    use_container_width=True,
+                                    icon=":material/folder_zip:"
+                                )
+
+                        if st.session_state.profile is not None:
+                            with st.expander("Render profile"):
+                                report = st.session_state.profile.report()
+                                if report["peak_rss"] is not None:
+                                    st.caption(f"Peak process memory: {report['peak_rss'] / 2 ** 20:.0f} MB")
+                                st.dataframe([
+                                    {"stage": name, "count": stage["count"], "total ms": stage["seconds"] * 1000,
+                                     "max ms": stage["max_seconds"] * 1000, "MB": stage["bytes"] / 2 ** 20}
+                                    for name, stage in report["stages"].items()
+                                ], hide_index=True, use_container_width=True)
+                                st.dataframe([
+                                    {"image": image["image"], "megapixels": image["source_megapixels"],
+                                     "tiles": ", ".join(f"{width}x{height}" for width, height in image["target_sizes"]),
+                                     "decode ms": image.get("decode", 0) * 1000, "fit ms": image.get("fit", 0) * 1000,
+                                     "total ms": image["seconds"] * 1000}
+                                    for image in report["images"]
+                                ], hide_index=True, use_container_width=True)
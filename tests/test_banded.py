@@ -0,0 +1,62 @@
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from collage.banded import BAND_PIXEL_BYTES, plan_bands, render_banded
+from collage.constants import MIN_BAND_ROWS
+from collage.layouts import plan_layout
+from collage.render import render_plan
+from collage.sources import source_sizes
+
+
+def encode(size, seed):
+    # Smooth content with some detail, like a photo
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    channels = [127 + 120 * np.sin(x / rng.uniform(5, 40) + y / rng.uniform(5, 40) + phase) for phase in range(3)]
+    buffer = io.BytesIO()
+    Image.fromarray(np.dstack(channels).astype(np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def band_cost(plan, width, decoded_bytes, top, bottom):
+    crossing = {placement.index for placement in plan if placement.y < bottom and placement.y + placement.height > top}
+    return (bottom - top) * width * BAND_PIXEL_BYTES + sum(decoded_bytes[index] for index in crossing)
+
+
+@pytest.mark.parametrize("layout", ["grid", "strip", "justified"])
+def test_bands_cover_the_canvas_within_budget(layout):
+    rng = random.Random(0)
+    for _ in range(20):
+        sizes = [(rng.randint(200, 4000), rng.randint(200, 4000)) for _ in range(rng.randint(4, 20))]
+        size = (rng.randint(1000, 6000), rng.randint(1000, 6000))
+        plan = plan_layout(layout, sizes, size, rng.randint(0, 50), rng=rng)
+        decoded_bytes = {index: width * height * 4 for index, (width, height) in enumerate(sizes)}
+        budget = rng.randint(2 ** 20, 2 ** 28)
+
+        bands = plan_bands(plan, size, decoded_bytes, budget)
+        assert bands[0][0] == 0 and bands[-1][1] == size[1]
+        assert all(previous[1] == band[0] for previous, band in zip(bands, bands[1:]))
+        for top, bottom in bands:
+            # Only a band as thin as allowed may go over the budget
+            assert bottom - top >= MIN_BAND_ROWS or bottom == size[1]
+            if band_cost(plan, size[0], decoded_bytes, top, bottom) > budget:
+                assert bottom - top <= MIN_BAND_ROWS
+
+
+@pytest.mark.parametrize("layout, size", [("grid", (1000, 700)), ("justified", (733, 1201))])
+def test_banded_render_matches_in_memory_render(layout, size):
+    images = [encode(source_size, seed)
+              for seed, source_size in enumerate([(400, 600), (640, 480), (300, 900), (810, 520), (520, 520)])]
+    plan = plan_layout(layout, source_sizes(images), size, 10)
+    expected = render_plan(plan, images, Image.new("RGB", size, "#203040"), cache=None)
+
+    buffer = io.BytesIO()
+    # A small budget, so tiles are split over several bands
+    bands = render_banded(plan, images, size, buffer, "#203040", memory_budget=4 * 2 ** 20)
+    assert len(bands) > 2
+    banded = np.asarray(Image.open(io.BytesIO(buffer.getvalue())), dtype=np.int16)
+    assert np.abs(banded - np.asarray(expected, dtype=np.int16)).max() <= 1
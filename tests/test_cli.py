@@ -0,0 +1,15 @@
+import pytest
+
+from collage.cli import parse_args
+
+
+@pytest.mark.parametrize("option, value", [("--padding", "51"), ("--export-quality", "500"),
+                                           ("--export-quality", "0")])
+def test_out_of_range_options_are_rejected(option, value, capsys):
+    with pytest.raises(SystemExit):
+        parse_args(["sets.txt", "-o", "out", option, value])
+    assert f"{option} must be between" in capsys.readouterr().err
+
+
+def test_export_quality_in_range_is_accepted():
+    assert parse_args(["sets.txt", "-o", "out", "--export-quality", "100"]).export_quality == 100
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from PIL import Image
+
+from collage.decode_cache import DecodeCache
+
+
+def gradient(size):
+    return Image.linear_gradient("L").resize(size).convert("RGB")
+
+
+def test_smallest_entry_covering_the_request_is_mapped(tmp_path):
+    cache = DecodeCache(str(tmp_path / "cache"), 2 ** 24)
+    assert cache.get("abc", (10, 10)) is None
+    for size in [(400, 300), (200, 150), (100, 75)]:
+        assert cache.put("abc", gradient(size))
+
+    hit = cache.get("abc", (150, 100))
+    assert hit.size == (200, 150)
+    assert hit.convert("RGB").tobytes() == gradient((200, 150)).tobytes()
+    assert cache.get("abc", (500, 10)) is None
+    assert cache.get("other", (10, 10)) is None
+    assert cache.stats()["entries"] == 3
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry_bytes = 100 * 100 * 4
+    cache = DecodeCache(str(tmp_path / "cache"), 2 * entry_bytes)
+    for index, digest in enumerate(["first", "second", "third"]):
+        cache.put(digest, gradient((100, 100)))
+        path = os.path.join(cache.directory, digest, "100x100.rgbx")
+        os.utime(path, (index, index))
+    cache._evict()
+
+    assert cache.get("first", (100, 100)) is None
+    assert cache.get("third", (100, 100)) is not None
+    assert not os.path.exists(os.path.join(cache.directory, "first"))
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_eviction_sees_entries_of_other_processes(tmp_path):
+    entry_bytes = 100 * 100 * 4
+    directory = str(tmp_path / "cache")
+    first, second = DecodeCache(directory, 8 * entry_bytes), DecodeCache(directory, 8 * entry_bytes)
+    for index in range(20):
+        (first if index % 2 else second).put(f"source{index}", gradient((100, 100)))
+    # Each process rescans after writing an eighth of the budget, so the overshoot stays within one entry each
+    assert first.stats()["bytes"] <= first.max_bytes + 2 * entry_bytes
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_directory_writable_by_others_is_refused(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(PermissionError):
+        DecodeCache(str(directory))
+
+
+def test_symlinked_directory_is_refused(tmp_path):
+    (tmp_path / "target").mkdir()
+    (tmp_path / "cache").symlink_to(tmp_path / "target")
+    with pytest.raises(PermissionError):
+        DecodeCache(str(tmp_path / "cache"))
@@ -0,0 +1,30 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from collage.export import PngWriter
+
+
+@pytest.mark.parametrize("width", [1, 7, 33, 250])
+def test_png_writer_decodes_back_identical(width):
+    rng = np.random.default_rng(width)
+    pixels = rng.integers(0, 256, (150, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    with PngWriter(buffer, (width, 150)) as writer:
+        # Bands of uneven heights, the last one shorter than the others
+        writer.write(pixels[:64])
+        writer.write(Image.fromarray(pixels[64:128]))
+        writer.write(Image.fromarray(pixels[128:]).convert("RGBA"))
+
+    decoded = Image.open(io.BytesIO(buffer.getvalue()))
+    assert (decoded.mode, decoded.size) == ("RGB", (width, 150))
+    assert np.array_equal(np.asarray(decoded), pixels)
+
+
+def test_png_writer_rejects_bands_that_do_not_fit():
+    with pytest.raises(ValueError):
+        PngWriter(io.BytesIO(), (10, 10)).write(np.zeros((10, 11, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        PngWriter(io.BytesIO(), (10, 10)).write(np.zeros((11, 10, 3), dtype=np.uint8))
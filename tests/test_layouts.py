@@ -0,0 +1,36 @@
+import itertools
+import random
+
+import pytest
+
+from collage.constants import SOCIAL_MEDIA_IMAGE_SIZES
+from collage.layouts import plan_justified
+
+
+def random_sizes(rng, count):
+    return [(rng.randint(200, 6000), rng.randint(200, 6000)) for _ in range(count)]
+
+
+def assert_inside_without_overlap(plan, canvas_size):
+    canvas_width, canvas_height = canvas_size
+    for placement in plan:
+        assert placement.width > 0 and placement.height > 0
+        assert 0 <= placement.x and placement.x + placement.width <= canvas_width
+        assert 0 <= placement.y and placement.y + placement.height <= canvas_height
+    for first, second in itertools.combinations(plan, 2):
+        assert (first.x + first.width <= second.x or second.x + second.width <= first.x
+                or first.y + first.height <= second.y or second.y + second.height <= first.y)
+
+
+@pytest.mark.parametrize("orientation", ["horizontal", "vertical", None])
+@pytest.mark.parametrize("centered", [False, True])
+def test_justified_stays_on_canvas(orientation, centered):
+    rng = random.Random(0)
+    for canvas_size in SOCIAL_MEDIA_IMAGE_SIZES.values():
+        for _ in range(20):
+            sizes = random_sizes(rng, rng.randint(4, 20))
+            padding = rng.randint(0, 50)
+            plan = plan_justified(sizes, canvas_size, padding, centered, orientation)
+            assert_inside_without_overlap(plan, canvas_size)
+            assert plan == [] or sorted(placement.index for placement in plan) == list(range(len(sizes)))
+
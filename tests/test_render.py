@@ -0,0 +1,35 @@
+import random
+
+from PIL import Image
+
+from collage import render
+from collage.render import TileCache
+
+
+def test_tile_cache_counts_rgb_pixels_as_four_bytes():
+    cache = TileCache(2 * 100 * 100 * 4)
+    for key in "abc":
+        cache.put(key, Image.new("RGB", (100, 100)))
+
+    stats = cache.stats()
+    assert stats["bytes"] == 2 * 100 * 100 * 4
+    assert (stats["entries"], stats["evictions"]) == (2, 1)
+    assert cache.get("a") is None
+
+
+def test_fanout_plans_every_size_alike_without_rewinding_the_global_rng(monkeypatch):
+    planned = []
+
+    def plan_layout(layout, sizes, canvas_size, padding, randomization, centered, rng):
+        planned.append(rng.random())
+        return []
+
+    monkeypatch.setattr(render, "plan_layout", plan_layout)
+    monkeypatch.setattr(render, "render_plans", lambda *args: None)
+    random.seed(1)
+    expected = random.Random(1)
+    expected.randrange(2 ** 31)
+    render.fanout_collages([], "grid", {"a": (100, 100), "b": (200, 100)}, 0, randomization=True)
+    assert planned[0] == planned[1]
+    # Exactly one draw from the global state, which is never rewound
+    assert random.random() == expected.random()
@@ -0,0 +1,28 @@
+import random
+
+import numpy as np
+import pytest
+
+from collage.constants import MAX_IMAGES, MIN_IMAGES, SOCIAL_MEDIA_IMAGE_SIZES
+from collage.layouts import plan_layout
+from collage.search import score_cells
+
+from test_layouts import assert_inside_without_overlap, random_sizes
+
+
+@pytest.mark.parametrize("padding", [0, 10, 50])
+def test_search_places_every_image_on_every_platform(padding):
+    rng = random.Random(padding)
+    for canvas_size in SOCIAL_MEDIA_IMAGE_SIZES.values():
+        for images_num in range(MIN_IMAGES, MAX_IMAGES + 1):
+            sizes = random_sizes(rng, images_num)
+            plan = plan_layout("search", sizes, canvas_size, padding)
+            assert_inside_without_overlap(plan, canvas_size)
+            assert sorted(placement.index for placement in plan) == list(range(images_num))
+
+
+def test_score_cells_prefers_matching_aspect_ratios():
+    cells = [(0, 0, 200, 100), (200, 0, 100, 200)]
+    sizes = [(2000, 1000), (1000, 2000)]
+    scores = score_cells(cells, np.array([[0, 1], [1, 0]]), sizes, (300, 200))
+    assert scores[0] < scores[1]
@@ -0,0 +1,102 @@
+import io
+import socket
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from collage import service
+
+
+def encode():
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+IMAGES = [encode()] * 4
+
+
+@pytest.fixture
+def slow_renders(monkeypatch):
+    # Each request renders for request["seconds"]
+    def render_request(request):
+        time.sleep(request["seconds"])
+        return b"collage"
+
+    monkeypatch.setattr(service, "render_request", render_request)
+
+
+def request(seconds, timeout):
+    return {"seconds": seconds, "timeout": timeout, "format": "JPEG"}
+
+
+def test_timed_out_render_keeps_its_worker_busy(slow_renders):
+    render_service = service.RenderService(workers=1, backend="thread")
+    try:
+        slow = render_service.submit(request(1.5, 0.3))
+        blocked = render_service.submit(request(0.1, 1.0))
+        later = render_service.submit(request(0.1, 5.0))
+        assert later.done.wait(5)
+        assert slow.status == "timeout"
+        # The only worker was still busy with the abandoned render, so this job never started
+        assert blocked.status == "timeout" and blocked.started is None
+        assert blocked.error == "Timed out waiting in the queue."
+        assert later.status == "done" and later.result == b"collage"
+    finally:
+        render_service.close()
+
+
+@pytest.mark.parametrize("field, value", [
+    ("background", "notacolor"),
+    ("timeout", "-5"),
+    ("timeout", "0"),
+    ("timeout", "nan"),
+    ("export_quality", "500"),
+    ("export_quality", "0"),
+    ("padding", "51"),
+    ("layout", "spiral"),
+])
+def test_parse_request_rejects_invalid_fields(field, value):
+    with pytest.raises(ValueError):
+        service.parse_request({field: value}, {"images": IMAGES})
+
+
+def test_parse_request_accepts_valid_fields():
+    request = service.parse_request({"background": "rebeccapurple", "timeout": "5", "export_quality": "100"},
+                                    {"images": IMAGES})
+    assert request["background"] == "rebeccapurple"
+    assert request["timeout"] == 5.0
+    assert request["export_quality"] == 100
+
+
+def test_parse_request_rejects_files_that_are_not_images():
+    with pytest.raises(ValueError, match="Image 2"):
+        service.parse_request({}, {"images": [IMAGES[0], b"not an image"] + IMAGES[2:]})
+
+
+@pytest.fixture
+def server():
+    server = service.make_server(port=0, service=service.RenderService(workers=1, backend="thread"), quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.service.close()
+
+
+def post(server, headers, body=b""):
+    with socket.create_connection(server.server_address, timeout=5) as connection:
+        connection.sendall(b"POST /render HTTP/1.1\r\nHost: localhost\r\n" + headers + b"\r\n" + body)
+        return connection.makefile("rb").readline()
+
+
+def test_bad_uploads_are_answered_with_400(server):
+    assert b" 400 " in post(server, b"Content-Length: abc\r\n")
+    assert b" 400 " in post(server, b"Content-Length: -1\r\n")
+    part = (b"--x\r\nContent-Disposition: form-data; name=\"images\"; filename=\"a.txt\"\r\n\r\ntext\r\n")
+    body = part * 4 + b"--x--\r\n"
+    headers = b"Content-Type: multipart/form-data; boundary=x\r\nContent-Length: %d\r\n" % len(body)
+    assert b" 400 " in post(server, headers, body)
+    assert not server.service.jobs
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+from PIL import ExifTags, Image
+
+from collage.sources import normalize_image
+
+
+def encode(size, orientation=1):
+    # Noise, which compresses about like photo detail
+    img = Image.effect_noise(size, 40).convert("RGB")
+    exif = img.getexif()
+    exif[ExifTags.Base.Orientation] = orientation
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("size, expected", [
+    ((3000, 4000), (2560, 3413)),
+    ((8000, 1000), (8000, 1000)),
+    ((2000, 1500), (2000, 1500)),
+])
+def test_normalize_image_bounds_the_short_side(size, expected):
+    data = encode(size)
+    normalized = normalize_image(data, 2560)
+    assert Image.open(io.BytesIO(normalized)).size == expected
+    assert len(normalized) <= len(data)
+
+
+def test_normalize_image_keeps_originals_smaller_than_the_result():
+    img = Image.linear_gradient("L").resize((3000, 4000)).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=30)
+    assert normalize_image(buffer.getvalue(), 2560) == buffer.getvalue()
+
+
+def test_normalize_image_keeps_small_upright_images():
+    data = encode((2000, 1500))
+    assert normalize_image(data, 2560) is data
+
+
+def test_normalize_image_rotates_upright():
+    normalized = Image.open(io.BytesIO(normalize_image(encode((2000, 1500), orientation=6), 2560)))
+    assert normalized.size == (1500, 2000)
+    assert normalized.getexif().get(ExifTags.Base.Orientation, 1) == 1